@@ -32,13 +32,14 @@ ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost,127.0.0.1').split(','
 # Application definition
 
 INSTALLED_APPS = [
+    # Выше django.contrib.admin, чтобы переопределять шаблоны админки
+    'music_school',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'music_school',
 ]
 
 MIDDLEWARE = [
@@ -47,6 +48,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'music_school.branches.BranchMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -63,6 +65,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'music_school.context_processors.branches',
             ],
         },
     },
@@ -79,7 +82,28 @@ if DEBUG:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
-        }
+            # Транзакции сразу берут блокировку записи, чтобы параллельные
+            # потоки (расчёт счетов и т.п.) ждали друг друга, а не падали
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # Тестовая база в файле: тесты с потоками работают с ней из разных соединений
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        },
+        # База отдельного филиала (Branch.database = 'branch2'), на ней же
+        # проверяется маршрутизация в тестах. Создаётся migrate --database branch2
+        'branch2': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_branch2.sqlite3',
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+            },
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db_branch2.sqlite3',
+            },
+        },
     }
 else:
     DATABASES = {
@@ -135,3 +159,50 @@ STATICFILES_DIRS = [BASE_DIR / 'staticfiles']
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Teacher workload
+# Пороги недельной нагрузки преподавателя (в часах) и время кэширования отчёта (в секундах)
+
+TEACHER_WORKLOAD_MIN_HOURS = config('TEACHER_WORKLOAD_MIN_HOURS', default=6, cast=float)
+TEACHER_WORKLOAD_MAX_HOURS = config('TEACHER_WORKLOAD_MAX_HOURS', default=24, cast=float)
+TEACHER_WORKLOAD_CACHE_TIMEOUT = config('TEACHER_WORKLOAD_CACHE_TIMEOUT', default=60, cast=int)
+
+
+# Billing
+# Скидка на второго и следующих детей одной семьи (в процентах), параллелизм и размер пакета расчёта;
+# расчёт без прогресса дольше BILLING_STALE_SECONDS считается прерванным и может быть перезапущен
+
+BILLING_SIBLING_DISCOUNT_PERCENT = config('BILLING_SIBLING_DISCOUNT_PERCENT', default=10, cast=int)
+BILLING_WORKERS = config('BILLING_WORKERS', default=4, cast=int)
+BILLING_CHUNK_SIZE = config('BILLING_CHUNK_SIZE', default=500, cast=int)
+BILLING_STALE_SECONDS = config('BILLING_STALE_SECONDS', default=600, cast=int)
+
+
+# Archive
+# Через сколько дней после окончания обучения зачисления и выпускники переносятся в архив
+
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', default=365, cast=int)
+ARCHIVE_BATCH_SIZE = config('ARCHIVE_BATCH_SIZE', default=1000, cast=int)
+
+
+# Branches
+# Код филиала, к которому относятся записи, созданные вне контекста филиала
+
+DEFAULT_BRANCH_CODE = config('DEFAULT_BRANCH_CODE', default='main')
+
+# Филиал с заполненным Branch.database обслуживается из этой базы,
+# если соответствующий псевдоним добавлен в DATABASES
+DATABASE_ROUTERS = ['music_school.routers.BranchRouter']
+
+
+# Parent notifications
+# Класс SMS-шлюза, ограничение скорости отправки и повторные попытки.
+# Шлюз-заглушка ничего не отправляет, поэтому без DEBUG шлюз нужно задать явно
+
+SMS_GATEWAY = config('SMS_GATEWAY', default='music_school.sms.FakeSMSGateway' if DEBUG else '')
+SMS_BATCH_SIZE = config('SMS_BATCH_SIZE', default=100, cast=int)
+SMS_RATE_PER_SECOND = config('SMS_RATE_PER_SECOND', default=20, cast=float)
+SMS_MAX_ATTEMPTS = config('SMS_MAX_ATTEMPTS', default=5, cast=int)
+SMS_RETRY_BASE_SECONDS = config('SMS_RETRY_BASE_SECONDS', default=60, cast=int)
+SMS_LEASE_SECONDS = config('SMS_LEASE_SECONDS', default=300, cast=int)
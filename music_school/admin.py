@@ -1,6 +1,22 @@
-from django.contrib import admin
-from django.utils.html import format_html
-from .models import Direction, Teacher, Student, Group, Enrollment
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.cache import cache
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+from .archive import restore_student
+from .attendance import annotate_attendance
+from .branches import branch_cache_key, get_current_branch
+from .enrollment import deactivate, enroll, promote_waitlist
+from .models import (
+    Branch, Direction, Teacher, Student, Group, Enrollment, Lesson, Attendance, BillingRun, Invoice, WaitlistEntry,
+    ArchivedStudent, ArchivedEnrollment, OutboxEvent, OutboxConsumer, Notification, NotificationDelivery,
+)
+from .notifications import delivery_stats, enqueue, notify
+from .workload import annotate_workload, compute_workload, load_status
 
 # Inline-модели для отображения связей
 class GroupInline(admin.TabularInline):
@@ -31,6 +47,23 @@ class StudentGroupsInline(admin.TabularInline):
     max_num = 0
     show_change_link = True
 
+class WaitlistInline(admin.TabularInline):
+    """Inline для отображения листа ожидания группы"""
+    model = WaitlistEntry
+    extra = 0
+    fields = ('student', 'created_at')
+    readonly_fields = ('created_at',)
+    autocomplete_fields = ('student',)
+
+class AttendanceInline(admin.TabularInline):
+    """Inline для просмотра отметок занятия (изменяются через API отметки)"""
+    model = Attendance
+    extra = 0
+    fields = ('student', 'status')
+    readonly_fields = ('student', 'status')
+    can_delete = False
+    max_num = 0
+
 # Фильтры для админки
 class YearOfStudyFilter(admin.SimpleListFilter):
     """Фильтр по году обучения для групп"""
@@ -68,11 +101,67 @@ class ActiveStatusFilter(admin.SimpleListFilter):
         if self.value() == 'inactive':
             return queryset.filter(is_active=False)
 
+class EnrollmentSaveMixin:
+    """Сохраняет зачисления через music_school.enrollment, чтобы учитывать места в группах"""
+    
+    def save_enrollment(self, request, obj, change, changed_fields):
+        if change and 'is_active' not in changed_fields:
+            obj.save()
+            return
+        if not change:
+            if obj.is_active:
+                # Новое зачисление создаёт сервис: при заполненной группе записи не будет, только лист ожидания
+                self.enroll_new(request, obj)
+            else:
+                obj.save()
+            return
+        wants_active = obj.is_active
+        # Сначала сохраняем прочие поля с прежним статусом, затем меняем статус сервисом
+        obj.is_active = not wants_active
+        obj.save()
+        if not wants_active:
+            for promoted in deactivate(obj):
+                messages.info(request, f"Из листа ожидания зачислен: {promoted.student}")
+            return
+        result = enroll(obj.student, obj.group)
+        if isinstance(result, WaitlistEntry):
+            messages.warning(request, f"Группа {obj.group.name} заполнена, {obj.student} добавлен в лист ожидания")
+        else:
+            obj.is_active = True
+    
+    def enroll_new(self, request, obj):
+        result = enroll(obj.student, obj.group)
+        if isinstance(result, WaitlistEntry):
+            messages.warning(request, f"Группа {obj.group.name} заполнена, {obj.student} добавлен в лист ожидания")
+            return
+        obj.pk = result.pk
+        obj.date_joined = result.date_joined
+        obj.date_left = result.date_left
+        obj._state.adding = False
+        obj._state.db = result._state.db
+    
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not Enrollment:
+            return super().save_formset(request, form, formset, change)
+        formset.save(commit=False)
+        for obj in formset.deleted_objects:
+            obj.delete()
+        for obj in formset.new_objects:
+            self.save_enrollment(request, obj, False, [])
+        for obj, changed_fields in formset.changed_objects:
+            self.save_enrollment(request, obj, True, changed_fields)
+
 # Модели админки
+@admin.register(Branch)
+class BranchAdmin(admin.ModelAdmin):
+    list_display = ('name', 'code', 'database')
+    search_fields = ('name', 'code')
+    prepopulated_fields = {'code': ('name',)}
+
 @admin.register(Direction)
 class DirectionAdmin(admin.ModelAdmin):
-    list_display = ('name', 'years_of_study', 'teachers_count', 'groups_count')
-    list_filter = ('years_of_study',)
+    list_display = ('name', 'years_of_study', 'monthly_fee', 'teachers_count', 'groups_count')
+    list_filter = ('branch', 'years_of_study')
     search_fields = ('name', 'description')
     readonly_fields = ('teachers_count', 'groups_count')
     inlines = [GroupInline]
@@ -87,24 +176,87 @@ class DirectionAdmin(admin.ModelAdmin):
 
 @admin.register(Teacher)
 class TeacherAdmin(admin.ModelAdmin):
-    list_display = ('last_name', 'first_name', 'middle_name', 'directions_list', 'active_groups_count', 'is_active')
-    list_filter = ('is_active', 'directions')
+    list_display = ('last_name', 'first_name', 'middle_name', 'directions_list', 'active_groups_count', 'weekly_hours', 'contacts_count', 'is_active')
+    list_filter = ('branch', 'is_active', 'directions')
     search_fields = ('last_name', 'first_name', 'middle_name')
     filter_horizontal = ('directions',)
-    readonly_fields = ('active_groups_count',)
+    readonly_fields = ('active_groups_count', 'weekly_hours', 'contacts_count')
+    change_list_template = 'admin/music_school/teacher/change_list.html'
+    
+    def get_queryset(self, request):
+        return annotate_workload(super().get_queryset(request)).prefetch_related('directions')
+    
+    def get_urls(self):
+        urls = [
+            path(
+                'workload/',
+                self.admin_site.admin_view(self.workload_view),
+                name='music_school_teacher_workload',
+            ),
+        ]
+        return urls + super().get_urls()
+    
+    def workload_view(self, request):
+        """Отчёт о нагрузке преподавателей по направлениям"""
+        workloads, directions = cache.get_or_set(
+            branch_cache_key('music_school:teacher_workload'),
+            compute_workload,
+            settings.TEACHER_WORKLOAD_CACHE_TIMEOUT,
+        )
+        by_key = {w.key: w for w in workloads}
+        direction_rows = []
+        for summary in sorted(directions.values(), key=lambda d: d['name']):
+            teachers = sorted(
+                ((by_key[key], minutes) for key, minutes in summary['teachers'].items()),
+                key=lambda item: -item[1],
+            )
+            direction_rows.append({
+                'name': summary['name'],
+                'hours': round(summary['minutes'] / 60, 1),
+                'teachers': [
+                    {'workload': w, 'hours': round(minutes / 60, 1)}
+                    for w, minutes in teachers
+                ],
+            })
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Нагрузка преподавателей',
+            'workloads': sorted(workloads, key=lambda w: -w.minutes),
+            'directions': direction_rows,
+            'min_hours': settings.TEACHER_WORKLOAD_MIN_HOURS,
+            'max_hours': settings.TEACHER_WORKLOAD_MAX_HOURS,
+        }
+        return TemplateResponse(request, 'admin/music_school/teacher/workload.html', context)
     
     def directions_list(self, obj):
         return ", ".join([d.name for d in obj.directions.all()])
     directions_list.short_description = 'Направления'
     
     def active_groups_count(self, obj):
-        return obj.groups.count()
+        return obj.workload_groups
     active_groups_count.short_description = 'Кол-во групп'
+    active_groups_count.admin_order_field = 'workload_groups'
+    
+    def weekly_hours(self, obj):
+        hours = f"{obj.workload_minutes / 60:.1f}"
+        colors = {'over': '#ba2121', 'under': '#b08800'}
+        status = load_status(obj.workload_minutes)
+        if status in colors:
+            return format_html('<span style="color: {};">{}</span>', colors[status], hours)
+        return hours
+    weekly_hours.short_description = 'Часов в неделю'
+    weekly_hours.admin_order_field = 'workload_minutes'
+    
+    def contacts_count(self, obj):
+        return obj.workload_contacts
+    contacts_count.short_description = 'Активных учеников'
+    contacts_count.admin_order_field = 'workload_contacts'
 
 @admin.register(Student)
-class StudentAdmin(admin.ModelAdmin):
+class StudentAdmin(EnrollmentSaveMixin, admin.ModelAdmin):
     list_display = ('last_name', 'first_name', 'middle_name', 'age', 'phone_parent', 'active_groups_count')
-    list_filter = (ActiveStatusFilter,)
+    list_filter = ('branch', ActiveStatusFilter)
     search_fields = ('last_name', 'first_name', 'middle_name', 'phone_parent')
     readonly_fields = ('age', 'active_groups_count')
     inlines = [StudentGroupsInline]
@@ -114,25 +266,73 @@ class StudentAdmin(admin.ModelAdmin):
     active_groups_count.short_description = 'Активных групп'
 
 @admin.register(Group)
-class GroupAdmin(admin.ModelAdmin):
-    list_display = ('name', 'direction', 'year_of_study', 'teacher', 'students_count', 'schedule')
-    list_filter = ('direction', YearOfStudyFilter, 'teacher')
+class GroupAdmin(EnrollmentSaveMixin, admin.ModelAdmin):
+    list_display = ('name', 'direction', 'year_of_study', 'teacher', 'students_count', 'places', 'attendance', 'schedule')
+    list_filter = ('branch', 'direction', YearOfStudyFilter, 'teacher')
     search_fields = ('name', 'direction__name', 'teacher__last_name')
-    readonly_fields = ('students_count',)
-    inlines = [EnrollmentInline]
+    readonly_fields = ('students_count', 'weekly_minutes', 'active_count')
+    inlines = [EnrollmentInline, WaitlistInline]
+    
+    def get_queryset(self, request):
+        return annotate_attendance(super().get_queryset(request))
     
     def students_count(self, obj):
         return obj.students.count()
     students_count.short_description = 'Кол-во студентов'
+    
+    def attendance(self, obj):
+        if obj.attendance_rate is None:
+            return '-'
+        return f"{obj.attendance_rate:.0%}"
+    attendance.short_description = 'Посещаемость'
+    attendance.admin_order_field = 'attendance_rate'
+    
+    def places(self, obj):
+        if obj.capacity is None:
+            return obj.active_count
+        return f"{obj.active_count}/{obj.capacity}"
+    places.short_description = 'Занято мест'
+    places.admin_order_field = 'active_count'
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'schedule' in form.changed_data:
+            notification = notify(
+                f"Изменилось расписание группы {obj.name}: {obj.schedule}",
+                Notification.Kind.SCHEDULE_CHANGE,
+                group=obj,
+            )
+            self.message_user(
+                request,
+                f"Родителям поставлено в очередь уведомлений: {notification.deliveries.count()}",
+            )
+        if change and 'capacity' in form.changed_data:
+            for promoted in promote_waitlist(obj.pk):
+                messages.info(request, f"Из листа ожидания зачислен: {promoted.student}")
 
 @admin.register(Enrollment)
-class EnrollmentAdmin(admin.ModelAdmin):
-    list_display = ('student', 'group', 'date_joined', 'is_active', 'duration_days')
-    list_filter = ('is_active', 'date_joined', 'group__direction')
+class EnrollmentAdmin(EnrollmentSaveMixin, admin.ModelAdmin):
+    list_display = ('student', 'group', 'date_joined', 'is_active', 'duration_days', 'attendance')
+    list_filter = ('branch', 'is_active', 'date_joined', 'group__direction')
     search_fields = ('student__last_name', 'student__first_name', 'group__name')
-    readonly_fields = ('date_joined', 'duration_days')
+    readonly_fields = ('date_joined', 'date_left', 'duration_days', 'lessons_marked', 'lessons_attended')
     list_editable = ('is_active',)
     
+    def get_readonly_fields(self, request, obj=None):
+        # Перенос зачисления в другую группу обошёл бы учёт мест
+        if obj is not None:
+            return self.readonly_fields + ('student', 'group')
+        return self.readonly_fields
+    
+    def save_model(self, request, obj, form, change):
+        self.save_enrollment(request, obj, change, form.changed_data)
+    
+    def response_add(self, request, obj, post_url_continue=None):
+        if obj.pk is None:
+            # Группа заполнена: студент попал в лист ожидания, зачисления нет
+            return HttpResponseRedirect(reverse('admin:music_school_waitlistentry_changelist'))
+        return super().response_add(request, obj, post_url_continue)
+    
     def duration_days(self, obj):
         from datetime import date
         if obj.date_joined:
@@ -140,6 +340,209 @@ class EnrollmentAdmin(admin.ModelAdmin):
             return delta.days
         return 0
     duration_days.short_description = 'Дней в группе'
+    
+    def attendance(self, obj):
+        if obj.attendance_rate is None:
+            return '-'
+        return f"{obj.attendance_rate:.0%} ({obj.lessons_attended}/{obj.lessons_marked})"
+    attendance.short_description = 'Посещаемость'
+
+@admin.register(Lesson)
+class LessonAdmin(admin.ModelAdmin):
+    list_display = ('group', 'date', 'marked_count', 'attended_count')
+    list_filter = ('group__direction', 'date')
+    search_fields = ('group__name',)
+    date_hierarchy = 'date'
+    list_select_related = ('group__direction',)
+    readonly_fields = ('marked_count', 'attended_count')
+    inlines = [AttendanceInline]
+
+@admin.register(BillingRun)
+class BillingRunAdmin(admin.ModelAdmin):
+    list_display = ('period', 'status', 'enrollments_processed', 'invoices_created', 'elapsed_seconds', 'throughput_display', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('period', 'status', 'last_enrollment_id', 'enrollments_processed', 'invoices_created', 'elapsed_seconds', 'throughput_display', 'started_at', 'finished_at', 'heartbeat_at', 'database')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def throughput_display(self, obj):
+        if obj.throughput is None:
+            return '-'
+        return f"{obj.throughput:.0f}"
+    throughput_display.short_description = 'Зачислений в секунду'
+
+@admin.register(Invoice)
+class InvoiceAdmin(admin.ModelAdmin):
+    list_display = ('description', 'period', 'phone_parent', 'base_amount', 'discount', 'amount')
+    list_filter = ('period', 'enrollment__group__direction')
+    search_fields = ('description', 'phone_parent')
+    readonly_fields = ('enrollment', 'period', 'description', 'phone_parent', 'base_amount', 'discount', 'amount', 'created_at')
+    date_hierarchy = 'period'
+    
+    def has_add_permission(self, request):
+        return False
+
+class ParentBranchMixin:
+    """Ограничивает текущим филиалом модели без собственного поля branch"""
+    branch_lookup = None
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        branch = get_current_branch()
+        if branch is not None:
+            queryset = queryset.filter(**{self.branch_lookup: branch})
+        return queryset
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(ParentBranchMixin, admin.ModelAdmin):
+    branch_lookup = 'group__branch'
+    list_display = ('student', 'group', 'created_at')
+    list_filter = ('group__direction', 'group')
+    search_fields = ('student__last_name', 'student__first_name', 'group__name')
+    list_select_related = ('student', 'group__direction')
+
+class ArchiveAdminMixin:
+    """Архив доступен только для просмотра"""
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class RestoreStudentsForm(forms.Form):
+    group = forms.ModelChoiceField(queryset=Group.objects.none(), label='Зачислить в группу')
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Список групп строится в запросе, чтобы учесть текущий филиал
+        self.fields['group'].queryset = Group.objects.select_related('direction')
+
+@admin.register(ArchivedStudent)
+class ArchivedStudentAdmin(ArchiveAdminMixin, admin.ModelAdmin):
+    list_display = ('last_name', 'first_name', 'middle_name', 'birth_date', 'phone_parent', 'archived_at')
+    search_fields = ('last_name', 'first_name', 'middle_name', 'phone_parent')
+    date_hierarchy = 'archived_at'
+    fields = ('original_id', 'last_name', 'first_name', 'middle_name', 'birth_date', 'phone_parent', 'archived_at', 'history')
+    readonly_fields = fields
+    actions = ['restore']
+    
+    def history(self, obj):
+        enrollments = ArchivedEnrollment.objects.filter(student_id=obj.original_id)
+        return format_html_join(
+            '', '<div>{} ({} - {}), посещено {} из {}</div>',
+            (
+                (e.group_name, f"{e.date_joined:%d.%m.%Y}", f"{e.date_left:%d.%m.%Y}" if e.date_left else '?',
+                 e.lessons_attended, e.lessons_marked)
+                for e in enrollments
+            ),
+        ) or '-'
+    history.short_description = 'История обучения'
+    
+    def has_restore_permission(self, request):
+        return request.user.has_perm('music_school.add_student')
+    
+    @admin.action(description='Восстановить из архива', permissions=['restore'])
+    def restore(self, request, queryset):
+        # Без зачисления в группу следующая архивация снова вернула бы студента в архив
+        form = RestoreStudentsForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            group = form.cleaned_data['group']
+            if queryset.exclude(branch=group.branch_id).exists():
+                self.message_user(request, f"Группа {group.name} из другого филиала", messages.ERROR)
+                return None
+            archived = list(queryset)
+            for student in archived:
+                restore_student(student, group)
+            waiting = WaitlistEntry.objects.filter(group=group, student_id__in=[a.original_id for a in archived]).count()
+            self.message_user(
+                request,
+                f"Восстановлено студентов: {len(archived)}, из них в листе ожидания группы {group.name}: {waiting}",
+            )
+            return None
+        return TemplateResponse(request, 'admin/music_school/archivedstudent/restore.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Восстановление из архива',
+            'queryset': queryset,
+            'form': form,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+@admin.register(ArchivedEnrollment)
+class ArchivedEnrollmentAdmin(ArchiveAdminMixin, admin.ModelAdmin):
+    list_display = ('student_id', 'group_name', 'date_joined', 'date_left', 'lessons_attended', 'lessons_marked', 'archived_at')
+    list_filter = ('group__direction',)
+    search_fields = ('group_name', '=student_id')
+    date_hierarchy = 'date_joined'
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(ArchiveAdminMixin, admin.ModelAdmin):
+    list_display = ('position', 'model', 'object_id', 'operation', 'created_at')
+    list_filter = ('model', 'operation')
+    search_fields = ('=object_id',)
+    show_full_result_count = False
+
+@admin.register(OutboxConsumer)
+class OutboxConsumerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'position', 'updated_at')
+    search_fields = ('name',)
+
+class DeliveryStatusFilter(admin.SimpleListFilter):
+    title = 'Есть недоставленные'
+    parameter_name = 'undelivered'
+    
+    def lookups(self, request, model_admin):
+        return [('yes', 'Да')]
+    
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(deliveries__status=NotificationDelivery.Status.FAILED).distinct()
+        return queryset
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'kind', 'group', 'short_text', 'delivery')
+    list_filter = ('branch', 'kind', DeliveryStatusFilter)
+    search_fields = ('text', 'group__name')
+    date_hierarchy = 'created_at'
+    list_select_related = ('group',)
+    
+    def get_readonly_fields(self, request, obj=None):
+        # Разосланное уведомление не редактируется
+        if obj:
+            return ('group', 'kind', 'text', 'created_at', 'delivery')
+        return ()
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            queued = enqueue(obj)
+            self.message_user(request, f"Поставлено в очередь сообщений: {queued}")
+    
+    def short_text(self, obj):
+        return obj.text if len(obj.text) <= 60 else obj.text[:57] + '...'
+    short_text.short_description = 'Текст'
+    
+    def delivery(self, obj):
+        stats = delivery_stats(obj)
+        return ', '.join(
+            f"{label}: {stats[value]}" for value, label in NotificationDelivery.Status.choices if stats.get(value)
+        ) or '-'
+    delivery.short_description = 'Доставка'
+
+@admin.register(NotificationDelivery)
+class NotificationDeliveryAdmin(ParentBranchMixin, ArchiveAdminMixin, admin.ModelAdmin):
+    branch_lookup = 'notification__branch'
+    list_display = ('phone', 'notification', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'last_error')
+    list_filter = ('status', 'notification__kind')
+    search_fields = ('phone', '=gateway_message_id')
+    list_select_related = ('notification', 'notification__group')
+    show_full_result_count = False
 
 # Дополнительные настройки админки
 admin.site.site_header = 'Панель управления Музыкальной школой'
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MusicSchoolConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'music_school'
+
+    def ready(self):
+        from . import signals  # noqa: F401
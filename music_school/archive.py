@@ -0,0 +1,174 @@
+"""Перенос выпускников и завершённых зачислений из рабочих таблиц в архив.
+
+Записи переносятся пачками, каждая пачка - отдельная транзакция: копия
+в архивные таблицы и удаление из рабочих происходят вместе.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import outbox
+from .enrollment import enroll
+from .models import (
+    ArchivedAttendance, ArchivedEnrollment, ArchivedStudent, Attendance, Enrollment, Student, WaitlistEntry,
+)
+from .utils import bulk_insert_raw
+
+
+def archive_cutoff(days=None):
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    return timezone.localdate() - timedelta(days=days)
+
+
+def stale_enrollments(cutoff):
+    """Неактивные зачисления, завершённые до cutoff"""
+    return Enrollment.objects.annotate(
+        ended=Coalesce('date_left', 'date_joined'),
+    ).filter(is_active=False, ended__lt=cutoff)
+
+
+def graduated_students(cutoff):
+    """Студенты без активных и недавно завершённых зачислений, которые когда-либо учились.
+
+    Студенты из листов ожидания выпускниками не считаются.
+    """
+    recent = stale_enrollments(cutoff).values('pk')
+    current = Enrollment.objects.filter(student=OuterRef('pk')).filter(
+        Q(is_active=True) | ~Q(pk__in=recent)
+    )
+    studied = (
+        Exists(Enrollment.objects.filter(student=OuterRef('pk')))
+        | Exists(ArchivedEnrollment.objects.filter(student_id=OuterRef('pk')))
+    )
+    waiting = WaitlistEntry.objects.filter(student=OuterRef('pk'))
+    return Student.objects.filter(studied).exclude(Exists(current)).exclude(Exists(waiting))
+
+
+def _archive_enrollment_rows(enrollments):
+    ArchivedEnrollment.objects.bulk_create([
+        ArchivedEnrollment(
+            branch_id=e.branch_id,
+            original_id=e.pk,
+            student_id=e.student_id,
+            group_id=e.group_id,
+            group_name=e.group.name,
+            date_joined=e.date_joined,
+            date_left=e.date_left,
+            lessons_marked=e.lessons_marked,
+            lessons_attended=e.lessons_attended,
+        )
+        for e in enrollments
+    ])
+
+
+def archive_students(cutoff, batch_size=None):
+    """Переносит выпускников вместе с их зачислениями и посещаемостью"""
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    total = 0
+    while True:
+        with transaction.atomic(using=router.db_for_write(Student)):
+            students = list(graduated_students(cutoff).order_by('pk')[:batch_size])
+            if not students:
+                break
+            ids = [s.pk for s in students]
+            ArchivedStudent.objects.bulk_create([
+                ArchivedStudent(
+                    branch_id=s.branch_id,
+                    original_id=s.pk,
+                    first_name=s.first_name,
+                    last_name=s.last_name,
+                    middle_name=s.middle_name,
+                    birth_date=s.birth_date,
+                    phone_parent=s.phone_parent,
+                )
+                for s in students
+            ])
+            _archive_enrollment_rows(Enrollment.objects.filter(student_id__in=ids).select_related('group'))
+            ArchivedAttendance.objects.bulk_create(
+                [
+                    ArchivedAttendance(lesson_id=lesson_id, student_id=student_id, status=status)
+                    for lesson_id, student_id, status in Attendance.objects.filter(student_id__in=ids)
+                    .values_list('lesson_id', 'student_id', 'status').iterator()
+                ],
+                batch_size=batch_size,
+            )
+            # Каскадно удаляет зачисления, посещаемость и лист ожидания
+            Student.objects.filter(pk__in=ids).delete()
+        total += len(ids)
+    return total
+
+
+def archive_enrollments(cutoff, batch_size=None):
+    """Переносит давно завершённые зачисления студентов, которые продолжают учиться"""
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    total = 0
+    while True:
+        with transaction.atomic(using=router.db_for_write(Enrollment)):
+            enrollments = list(stale_enrollments(cutoff).select_related('group').order_by('pk')[:batch_size])
+            if not enrollments:
+                break
+            _archive_enrollment_rows(enrollments)
+            Enrollment.objects.filter(pk__in=[e.pk for e in enrollments]).delete()
+        total += len(enrollments)
+    return total
+
+
+def archive(days=None, batch_size=None):
+    """Архивирует выпускников и старые зачисления. Возвращает (студентов, зачислений)"""
+    cutoff = archive_cutoff(days)
+    return archive_students(cutoff, batch_size), archive_enrollments(cutoff, batch_size)
+
+
+def restore_student(archived, group=None):
+    """Возвращает студента из архива с историей зачислений и посещаемости.
+
+    Студент получает прежний id; зачисления восстанавливаются неактивными,
+    кроме тех, чьи группы уже удалены - они остаются в архиве. Если указана
+    group, студент сразу зачисляется в неё (или в её лист ожидания), иначе
+    следующая архивация снова перенесёт его в архив. Возвращает Student.
+    """
+    using = router.db_for_write(Student)
+    with transaction.atomic(using=using):
+        student = Student.objects.create(
+            pk=archived.original_id,
+            branch_id=archived.branch_id,
+            first_name=archived.first_name,
+            last_name=archived.last_name,
+            middle_name=archived.middle_name,
+            birth_date=archived.birth_date,
+            phone_parent=archived.phone_parent,
+        )
+        history = ArchivedEnrollment.objects.filter(student_id=archived.original_id, group__isnull=False)
+        # Сырая вставка сохраняет исходные id и даты зачисления (auto_now_add)
+        enrollments = [
+            Enrollment(
+                pk=e.original_id,
+                branch_id=e.branch_id,
+                student=student,
+                group_id=e.group_id,
+                date_joined=e.date_joined,
+                date_left=e.date_left,
+                is_active=False,
+                lessons_marked=e.lessons_marked,
+                lessons_attended=e.lessons_attended,
+            )
+            for e in history
+        ]
+        bulk_insert_raw(Enrollment, enrollments, using=using)
+        outbox.record(enrollments, 'insert')
+        history.delete()
+
+        attendance = ArchivedAttendance.objects.filter(student_id=archived.original_id)
+        Attendance.objects.bulk_create(
+            [Attendance(lesson_id=a.lesson_id, student=student, status=a.status) for a in attendance.iterator()],
+            batch_size=settings.ARCHIVE_BATCH_SIZE,
+        )
+        attendance.delete()
+        archived.delete()
+        if group is not None:
+            enroll(student, group)
+    return student
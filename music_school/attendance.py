@@ -0,0 +1,76 @@
+"""Пакетная отметка посещаемости и предрасчитанные показатели"""
+from django.db import router, transaction
+from django.db.models import FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, NullIf
+
+from .models import Attendance, Enrollment, Lesson
+
+BATCH_SIZE = 500
+
+
+def mark_attendance(group, date, marks):
+    """Отмечает посещаемость всей группы за одно занятие.
+
+    marks - словарь {student_id: Attendance.Status}; отмечать можно только
+    студентов с активным зачислением в группу. Повторная отметка того же
+    занятия обновляет статусы (upsert), а счётчики занятия и зачислений
+    меняются только на разницу со старыми отметками. Возвращает Lesson.
+    """
+    with transaction.atomic(using=router.db_for_write(Lesson)):
+        lesson, _ = Lesson.objects.get_or_create(group=group, date=date)
+        # Блокировка занятия упорядочивает параллельные отметки одной группы
+        lesson = Lesson.objects.select_for_update().get(pk=lesson.pk)
+
+        enrollments = {
+            e.student_id: e
+            for e in Enrollment.objects.select_for_update().filter(
+                group=group, student_id__in=marks, is_active=True,
+            )
+        }
+        missing = set(marks) - set(enrollments)
+        if missing:
+            raise ValueError(f"Студенты не учатся в группе: {', '.join(map(str, sorted(missing)))}")
+
+        previous = dict(
+            Attendance.objects.filter(lesson=lesson, student_id__in=marks).values_list('student_id', 'status')
+        )
+
+        changed = []
+        for student_id, status in marks.items():
+            old = previous.get(student_id)
+            if old == status:
+                continue
+            enrollment = enrollments[student_id]
+            delta = (status in Attendance.ATTENDED) - (old in Attendance.ATTENDED)
+            if old is None:
+                enrollment.lessons_marked += 1
+                lesson.marked_count += 1
+            enrollment.lessons_attended += delta
+            lesson.attended_count += delta
+            changed.append(enrollment)
+
+        Attendance.objects.bulk_create(
+            [Attendance(lesson=lesson, student_id=sid, status=status) for sid, status in marks.items()],
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['lesson', 'student'],
+            update_fields=['status'],
+        )
+        if changed:
+            Enrollment.objects.bulk_update(changed, ['lessons_marked', 'lessons_attended'], batch_size=BATCH_SIZE)
+            lesson.save(update_fields=['marked_count', 'attended_count'])
+    return lesson
+
+
+def annotate_attendance(queryset):
+    """Добавляет к queryset групп долю посещений по счётчикам занятий"""
+    totals = (
+        Lesson.objects.filter(group=OuterRef('pk'))
+        .order_by()
+        .values('group')
+        .annotate(marked=Sum('marked_count'), attended=Sum('attended_count'))
+    )
+    return queryset.annotate(
+        attendance_rate=Cast(Subquery(totals.values('attended')), FloatField())
+        / NullIf(Cast(Subquery(totals.values('marked')), FloatField()), 0.0),
+    )
@@ -0,0 +1,220 @@
+"""Ежемесячный расчёт счетов по активным зачислениям"""
+import calendar
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .branches import school_databases, use_database
+from .models import BillingRun, Direction, Enrollment, Invoice
+from .utils import normalize_phone
+
+CENT = Decimal('0.01')
+
+
+class BillingInProgress(Exception):
+    """Расчёт этого месяца уже выполняется другим процессом"""
+
+
+def month_bounds(period):
+    """Первый и последний день месяца, в который попадает period"""
+    start = period.replace(day=1)
+    last_day = calendar.monthrange(start.year, start.month)[1]
+    return start, start.replace(day=last_day)
+
+
+def prorated_fee(fee, date_joined, period):
+    """Стоимость месяца пропорционально дням с даты зачисления"""
+    start, end = month_bounds(period)
+    if date_joined <= start:
+        return fee
+    days_in_month = end.day
+    days_billed = (end - date_joined).days + 1
+    return (fee * days_billed / days_in_month).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _billable(period):
+    _, end = month_bounds(period)
+    # Расчёт общий для всей школы, независимо от текущего филиала
+    return Enrollment.all_branches.filter(is_active=True, date_joined__lte=end)
+
+
+def _discounted_students(period, databases):
+    """Студенты, которым положена скидка как второму и следующему ребёнку.
+
+    Семья определяется по телефону родителя во всех базах школы; первым
+    считается студент первой по порядку базы с наименьшим id, остальные
+    получают скидку. Возвращает множество (база, id студента).
+    """
+    families = {}
+    for index, alias in enumerate(databases):
+        with use_database(alias):
+            rows = list(_billable(period).order_by().values_list('student_id', 'student__phone_parent').distinct())
+        for student_id, phone in rows:
+            phone = normalize_phone(phone)
+            # Без телефона семью не определить
+            if phone:
+                families.setdefault(phone, set()).add((index, student_id))
+    return {
+        (databases[index], student_id)
+        for members in families.values() if len(members) > 1
+        for index, student_id in sorted(members)[1:]
+    }
+
+
+def _bill_chunk(database, enrollment_ids, period, fees, discounted, discount_rate):
+    """Создаёт недостающие счета для пакета зачислений базы database в отдельной транзакции"""
+    try:
+        with use_database(database), transaction.atomic(using=router.db_for_write(Invoice)):
+            existing = set(
+                Invoice.all_branches.filter(period=period, enrollment_id__in=enrollment_ids)
+                .values_list('enrollment_id', flat=True)
+            )
+            rows = (
+                Enrollment.all_branches.filter(pk__in=enrollment_ids)
+                .exclude(pk__in=existing)
+                .values(
+                    'pk', 'branch_id', 'date_joined', 'student_id', 'group__direction_id', 'group__name',
+                    'student__last_name', 'student__first_name', 'student__phone_parent',
+                )
+            )
+            invoices = []
+            for row in rows:
+                base = prorated_fee(fees[row['group__direction_id']], row['date_joined'], period)
+                discount = Decimal(0)
+                if row['student_id'] in discounted:
+                    discount = (base * discount_rate).quantize(CENT, rounding=ROUND_HALF_UP)
+                invoices.append(Invoice(
+                    branch_id=row['branch_id'],
+                    enrollment_id=row['pk'],
+                    period=period,
+                    description=f"{row['student__last_name']} {row['student__first_name']}, {row['group__name']}",
+                    phone_parent=normalize_phone(row['student__phone_parent']),
+                    base_amount=base,
+                    discount=discount,
+                    amount=base - discount,
+                ))
+            # ignore_conflicts страхует от параллельного запуска того же месяца
+            Invoice.all_branches.bulk_create(invoices, ignore_conflicts=True)
+            # Пропущенные из-за конфликта строки не считаются созданными. Разность точна,
+            # потому что параллельный расчёт того же месяца не допускается (см. _claim)
+            created = Invoice.all_branches.filter(
+                period=period, enrollment_id__in=enrollment_ids,
+            ).count() - len(existing)
+        return len(enrollment_ids), created
+    finally:
+        # Поток пула держит собственное соединение с БД
+        connections.close_all()
+
+
+def _claim(run):
+    """Захватывает расчёт месяца. Возвращает False, если его ведёт другой процесс.
+
+    Условный UPDATE атомарен: из двух одновременных запусков захват
+    получит только один. Расчёт со статусом «выполняется», но без
+    прогресса дольше BILLING_STALE_SECONDS считается брошенным (процесс
+    упал) и может быть захвачен заново.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.BILLING_STALE_SECONDS)
+    return BillingRun.objects.filter(pk=run.pk).filter(
+        ~Q(status=BillingRun.Status.RUNNING) | Q(heartbeat_at__isnull=True) | Q(heartbeat_at__lt=stale)
+    ).update(status=BillingRun.Status.RUNNING, heartbeat_at=now) == 1
+
+
+def generate_invoices(period, workers=None, chunk_size=None, progress=None):
+    """Формирует счета за месяц по всем активным зачислениям.
+
+    Базы школы (основная и отдельные базы филиалов) обрабатываются по
+    очереди. Повторный запуск за тот же месяц безопасен: прерванный расчёт
+    продолжается с последнего целиком обработанного пакета, а завершённый
+    проходит зачисления заново и создаёт только недостающие счета
+    (например, для зачисленных после расчёта). Пакеты обрабатываются пулом
+    потоков. progress(run) вызывается после каждого пакета. Возвращает
+    BillingRun. Если расчёт этого месяца уже идёт, выбрасывает
+    BillingInProgress.
+    """
+    workers = workers or settings.BILLING_WORKERS
+    chunk_size = chunk_size or settings.BILLING_CHUNK_SIZE
+    period, _ = month_bounds(period)
+
+    run, _ = BillingRun.objects.get_or_create(period=period)
+    if not _claim(run):
+        raise BillingInProgress(f"Расчёт за {period:%m.%Y} уже выполняется")
+    run.refresh_from_db()
+    databases = school_databases()
+    if run.finished_at is not None or run.database not in databases:
+        # Новый проход: показатели скорости относятся к нему, счётчик счетов копится за месяц
+        run.database = databases[0]
+        run.last_enrollment_id = 0
+        run.enrollments_processed = 0
+        run.elapsed_seconds = 0
+        run.finished_at = None
+        run.save(update_fields=[
+            'database', 'last_enrollment_id', 'enrollments_processed', 'elapsed_seconds', 'finished_at',
+        ])
+
+    discounted = _discounted_students(period, databases)
+    discount_rate = Decimal(settings.BILLING_SIBLING_DISCOUNT_PERCENT) / 100
+
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for database in databases[databases.index(run.database):]:
+                if database != run.database:
+                    run.database = database
+                    run.last_enrollment_id = 0
+                    run.save(update_fields=['database', 'last_enrollment_id'])
+                with use_database(database):
+                    fees = dict(Direction.all_branches.values_list('pk', 'monthly_fee'))
+                    ids = list(
+                        _billable(period).filter(pk__gt=run.last_enrollment_id)
+                        .order_by('pk').values_list('pk', flat=True)
+                    )
+                chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+                students = {student_id for alias, student_id in discounted if alias == database}
+                futures = [
+                    pool.submit(_bill_chunk, database, chunk, period, fees, students, discount_rate)
+                    for chunk in chunks
+                ]
+                # Курсор сдвигается только по порядку пакетов, чтобы после сбоя ничего не пропустить
+                for chunk, future in zip(chunks, futures):
+                    processed, created = future.result()
+                    run.last_enrollment_id = chunk[-1]
+                    run.enrollments_processed += processed
+                    run.invoices_created += created
+                    run.elapsed_seconds += time.monotonic() - started
+                    started = time.monotonic()
+                    run.heartbeat_at = timezone.now()
+                    run.save(update_fields=[
+                        'last_enrollment_id', 'enrollments_processed', 'invoices_created', 'elapsed_seconds',
+                        'heartbeat_at',
+                    ])
+                    if progress:
+                        progress(run)
+    except Exception:
+        run.status = BillingRun.Status.FAILED
+        run.elapsed_seconds += time.monotonic() - started
+        run.save(update_fields=['status', 'elapsed_seconds'])
+        raise
+
+    run.status = BillingRun.Status.DONE
+    run.finished_at = timezone.now()
+    run.elapsed_seconds += time.monotonic() - started
+    run.save(update_fields=['status', 'finished_at', 'elapsed_seconds'])
+    return run
+
+
+def current_period():
+    return timezone.localdate().replace(day=1)
+
+
+def parse_period(value):
+    """Месяц из строки вида 2025-09"""
+    year, month = value.split('-')
+    return date(int(year), int(month), 1)
@@ -0,0 +1,121 @@
+"""Филиалы школы: текущий филиал запроса и фильтрация данных по нему.
+
+Текущий филиал хранится в contextvar. Его выставляет BranchMiddleware
+по сессии (переключение - параметром ?branch=<код>, ?branch=all
+сбрасывает выбор). Менеджер objects моделей филиала видит только
+данные текущего филиала; если филиал не выбран (команды, отчёты по
+всей школе), фильтр не применяется. Менеджер all_branches не
+фильтрует никогда.
+
+Данные филиала с собственной базой (Branch.database) видны только
+в его контексте. Задачи по всей школе обходят school_databases() и
+выполняются в use_database(alias) для каждой базы.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+from django.shortcuts import redirect
+
+_current_branch = ContextVar('music_school_branch', default=None)
+_current_database = ContextVar('music_school_database', default=None)
+
+SESSION_KEY = 'music_school_branch_id'
+
+
+def get_current_branch():
+    return _current_branch.get()
+
+
+@contextmanager
+def use_branch(branch):
+    """Выполняет блок кода в контексте филиала (None - все филиалы)"""
+    token = _current_branch.set(branch)
+    try:
+        yield branch
+    finally:
+        _current_branch.reset(token)
+
+
+def get_current_database():
+    return _current_database.get()
+
+
+@contextmanager
+def use_database(alias):
+    """Направляет запросы к данным филиалов в базу alias независимо от текущего филиала.
+
+    Контекст не переходит в потоки пула: их код оборачивается отдельно.
+    """
+    token = _current_database.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_database.reset(token)
+
+
+def school_databases():
+    """Псевдонимы баз с данными школы: основная и отдельные базы филиалов"""
+    Branch = apps.get_model('music_school', 'Branch')
+    aliases = ['default']
+    for alias in Branch.objects.exclude(database='').order_by('database').values_list('database', flat=True):
+        if alias in settings.DATABASES and alias not in aliases:
+            aliases.append(alias)
+    return aliases
+
+
+def default_branch():
+    """Филиал для записей, созданных вне контекста филиала"""
+    Branch = apps.get_model('music_school', 'Branch')
+    branch, _ = Branch.objects.get_or_create(
+        code=settings.DEFAULT_BRANCH_CODE,
+        defaults={'name': 'Основной филиал'},
+    )
+    return branch
+
+
+def branch_cache_key(key):
+    """Ключ кэша с учётом текущего филиала"""
+    branch = get_current_branch()
+    return f"{key}:{branch.pk if branch else 'all'}"
+
+
+class BranchQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        for obj in objs:
+            if obj.branch_id is None:
+                obj.branch = obj.resolve_branch()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class BranchManager(models.Manager):
+    """Менеджер, ограниченный текущим филиалом"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        branch = get_current_branch()
+        if branch is not None:
+            queryset = queryset.filter(branch=branch)
+        return queryset
+
+
+class BranchMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        Branch = apps.get_model('music_school', 'Branch')
+        if 'branch' in request.GET:
+            code = request.GET['branch']
+            branch = None if code == 'all' else Branch.objects.filter(code=code).first()
+            request.session[SESSION_KEY] = branch.pk if branch else None
+            # Убираем параметр, чтобы его не приняли за фильтр списка в админке
+            query = request.GET.copy()
+            del query['branch']
+            return redirect(f"{request.path}?{query.urlencode()}" if query else request.path)
+        branch_id = request.session.get(SESSION_KEY)
+        request.branch = Branch.objects.filter(pk=branch_id).first() if branch_id else None
+        with use_branch(request.branch):
+            return self.get_response(request)
@@ -0,0 +1,11 @@
+from .models import Branch
+
+
+def branches(request):
+    """Список филиалов и текущий филиал для переключателя в админке"""
+    if not request.path.startswith('/admin/') or not request.user.is_staff:
+        return {}
+    return {
+        'branches': Branch.objects.all(),
+        'current_branch': getattr(request, 'branch', None),
+    }
@@ -0,0 +1,220 @@
+"""Потоковая выгрузка и загрузка данных школы в сжатый NDJSON.
+
+Каждая таблица приложения (включая промежуточные таблицы M2M) выгружается
+в отдельный файл <app_label>.<model_name>.ndjson.gz пачками, без загрузки
+всей таблицы в память. Таблицы выгружаются параллельно. При загрузке
+таблицы идут уровнями по внешним ключам: таблицы одного уровня друг от
+друга не зависят и загружаются параллельно, каждая в своей транзакции.
+SQLite пишет только одним соединением, поэтому там, как и при очистке
+таблиц (flush), вся загрузка идёт последовательно в одной транзакции:
+при ошибке база остаётся прежней.
+
+Таблицы выгружаются в разных транзакциях, поэтому снимок согласован только
+если во время выгрузки данные не меняются.
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+
+from .utils import bulk_insert_raw, normalize_phone
+
+CHUNK_SIZE = 2000
+
+
+def school_models():
+    """Модели приложения, разбитые на уровни по зависимостям внешних ключей"""
+    models = list(apps.get_app_config('music_school').get_models(include_auto_created=True))
+    levels = {}
+
+    def level(model):
+        if model not in levels:
+            levels[model] = 0
+            parents = [
+                f.related_model for f in model._meta.local_concrete_fields
+                if f.is_relation and f.related_model in models and f.related_model is not model
+            ]
+            levels[model] = max((level(parent) + 1 for parent in parents), default=0)
+        return levels[model]
+
+    result = []
+    for model in models:
+        depth = level(model)
+        while len(result) <= depth:
+            result.append([])
+        result[depth].append(model)
+    return result
+
+
+class DumpEncoder(DjangoJSONEncoder):
+    """Сохраняет время с микросекундами (DjangoJSONEncoder обрезает их до миллисекунд)"""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def dump_path(directory, model):
+    return Path(directory) / f'{model._meta.label_lower}.ndjson.gz'
+
+
+class Anonymizer:
+    """Заменяет имена и телефоны родителей псевдонимами.
+
+    Телефоны хешируются с солью, случайной для каждой выгрузки: одинаковые
+    номера (братья и сёстры) остаются одинаковыми, но исходный номер
+    по выгрузке не восстановить.
+    """
+
+    def __init__(self):
+        self.salt = secrets.token_hex(16)
+
+    def phone(self, value):
+        digest = hashlib.sha256(f'{self.salt}:{normalize_phone(value)}'.encode()).hexdigest()
+        return '+7900' + str(int(digest, 16))[:7]
+
+    def __call__(self, model, row):
+        label = model._meta.label_lower
+        if label == 'music_school.outboxevent':
+            # Лента изменений хранит полные копии строк
+            row['payload'] = self.scrub(row['model'], row['object_id'], dict(row['payload']))
+            return row
+        return self.scrub(label, row[model._meta.pk.attname], row)
+
+    def scrub(self, label, pk, row):
+        if label in ('music_school.student', 'music_school.archivedstudent', 'music_school.teacher'):
+            prefix = 'Преподаватель' if label == 'music_school.teacher' else 'Студент'
+            row.update(last_name=f'{prefix}-{pk}', first_name='Имя', middle_name='')
+        if 'phone_parent' in row:
+            row['phone_parent'] = self.phone(row['phone_parent'])
+        if label == 'music_school.notificationdelivery':
+            row['phone'] = self.phone(row['phone'])
+        if label == 'music_school.invoice':
+            row['description'] = f'Счёт {pk}'
+        return row
+
+
+def dump_model(model, directory, chunk_size=CHUNK_SIZE, anonymize=None, using='default'):
+    """Выгружает одну таблицу. Возвращает количество строк"""
+    attnames = [f.attname for f in model._meta.local_concrete_fields]
+    rows = (
+        model._base_manager.using(using)
+        .order_by('pk')
+        .values_list(*attnames)
+        .iterator(chunk_size=chunk_size)
+    )
+    count = 0
+    try:
+        with gzip.open(dump_path(directory, model), 'wt', encoding='utf-8') as fh:
+            for values in rows:
+                row = dict(zip(attnames, values))
+                if anonymize:
+                    row = anonymize(model, row)
+                fh.write(json.dumps(row, cls=DumpEncoder, ensure_ascii=False))
+                fh.write('\n')
+                count += 1
+    finally:
+        connections.close_all()
+    return count
+
+
+def dump(directory, workers=4, chunk_size=CHUNK_SIZE, anonymize=False, using='default'):
+    """Выгружает все таблицы параллельно. Возвращает {модель: количество строк}"""
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    anonymizer = Anonymizer() if anonymize else None
+    models = [model for level in school_models() for model in level]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        counts = pool.map(lambda m: dump_model(m, directory, chunk_size, anonymizer, using), models)
+        return dict(zip(models, counts))
+
+
+def _read_chunks(model, directory, chunk_size):
+    fields = {f.attname: f for f in model._meta.local_concrete_fields}
+    chunk = []
+    with gzip.open(dump_path(directory, model), 'rt', encoding='utf-8') as fh:
+        for line in fh:
+            row = json.loads(line)
+            chunk.append(model(**{name: fields[name].to_python(value) for name, value in row.items()}))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _load(model, directory, chunk_size, using):
+    count = 0
+    for chunk in _read_chunks(model, directory, chunk_size):
+        bulk_insert_raw(model, chunk, using=using)
+        count += len(chunk)
+    return count
+
+
+def restore_model(model, directory, chunk_size=CHUNK_SIZE, using='default'):
+    """Загружает одну таблицу в отдельной транзакции. Возвращает количество строк"""
+    if not dump_path(directory, model).exists():
+        return 0
+    connection = connections[using]
+    try:
+        # Проверка внешних ключей откладывается до конца загрузки (restore проверяет всё
+        # разом). Отключать её нужно до начала транзакции: внутри неё SQLite
+        # игнорирует PRAGMA foreign_keys
+        with connection.constraint_checks_disabled(), transaction.atomic(using=using):
+            return _load(model, directory, chunk_size, using)
+    finally:
+        connections.close_all()
+
+
+def _restore_atomic(models, directory, chunk_size, flush, using):
+    """Очищает и загружает все таблицы одной транзакцией одного соединения"""
+    connection = connections[using]
+    counts = {}
+    with connection.constraint_checks_disabled(), transaction.atomic(using=using):
+        if flush:
+            tables = [model._meta.db_table for model in models]
+            connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tables))
+        for model in models:
+            path = dump_path(directory, model)
+            counts[model] = _load(model, directory, chunk_size, using) if path.exists() else 0
+        connection.check_constraints(table_names=[model._meta.db_table for model in models])
+    return counts
+
+
+def restore(directory, workers=4, chunk_size=CHUNK_SIZE, flush=False, using='default'):
+    """Загружает выгрузку уровнями по внешним ключам.
+
+    При flush таблицы приложения предварительно очищаются в той же
+    транзакции, что и загрузка. Возвращает {модель: количество строк}.
+    FileNotFoundError, если в каталоге нет ни одного файла выгрузки.
+    """
+    levels = school_models()
+    models = [model for level in levels for model in level]
+    if not any(dump_path(directory, model).exists() for model in models):
+        raise FileNotFoundError(f"В каталоге {directory} нет файлов выгрузки")
+    connection = connections[using]
+
+    if flush or connection.vendor == 'sqlite':
+        counts = _restore_atomic(models, directory, chunk_size, flush, using)
+    else:
+        counts = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for level in levels:
+                results = pool.map(lambda m: restore_model(m, directory, chunk_size, using), level)
+                counts.update(zip(level, results))
+        connection.check_constraints(table_names=[model._meta.db_table for model in models])
+
+    sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
+    if sequence_sql:
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+    return counts
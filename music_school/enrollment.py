@@ -0,0 +1,148 @@
+"""Зачисление с учётом вместимости групп и листа ожидания.
+
+Занятость группы хранится в Group.active_count. Сервисы этого модуля
+меняют её условным атомарным UPDATE одной строки группы, поэтому
+параллельные зачисления в разные группы не мешают друг другу, а в одну
+группу - не переполняют её. Зачисления, сохранённые напрямую (save,
+create, get_or_create), учитываются сигналами через sync_saved, но
+вместимость при этом не проверяется. Массовые bulk_create/update счётчик
+не меняют. Операции идут по id, поэтому используют менеджер all_branches.
+"""
+from django.db import router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Enrollment, Group, WaitlistEntry
+
+
+def _take_place(group_id):
+    """Занимает место в группе, если оно есть. Возвращает True при успехе"""
+    return Group.all_branches.filter(
+        Q(capacity__isnull=True) | Q(active_count__lt=F('capacity')),
+        pk=group_id,
+    ).update(active_count=F('active_count') + 1) == 1
+
+
+def _release_place(group_id):
+    Group.all_branches.filter(pk=group_id, active_count__gt=0).update(active_count=F('active_count') - 1)
+
+
+def _locked_enrollment(student_id, group_id):
+    """Зачисление студента в группу, заблокированное до конца транзакции.
+
+    Если записи нет, она создаётся неактивной: параллельные запросы того же
+    студента упираются в unique (student, group) и ждут, а не занимают
+    второе место. Возвращает (зачисление, создано ли).
+    """
+    enrollment, created = Enrollment.all_branches.get_or_create(
+        student_id=student_id,
+        group_id=group_id,
+        defaults={'is_active': False},
+    )
+    return Enrollment.all_branches.select_for_update().get(pk=enrollment.pk), created
+
+
+def _activate(enrollment):
+    # UPDATE без save: место уже занято, сигнал не должен учесть его повторно
+    today = timezone.localdate()
+    Enrollment.all_branches.filter(pk=enrollment.pk).update(is_active=True, date_left=None, date_joined=today)
+    enrollment.is_active = True
+    enrollment.date_left = None
+    enrollment.date_joined = today
+    WaitlistEntry.objects.filter(student_id=enrollment.student_id, group_id=enrollment.group_id).delete()
+    return enrollment
+
+
+def enroll(student, group):
+    """Зачисляет студента в группу или ставит в лист ожидания.
+
+    Возвращает Enrollment, если место нашлось (или студент уже учится
+    в группе), иначе WaitlistEntry. Дата зачисления - день активации.
+    """
+    with transaction.atomic(using=router.db_for_write(Enrollment)):
+        enrollment, created = _locked_enrollment(student.pk, group.pk)
+        if enrollment.is_active:
+            return enrollment
+        if _take_place(group.pk):
+            return _activate(enrollment)
+        if created:
+            # Пустая запись нужна была только для блокировки
+            enrollment.delete()
+        entry, _ = WaitlistEntry.objects.get_or_create(student=student, group=group)
+        return entry
+
+
+def deactivate(enrollment):
+    """Завершает обучение и переводит в группу первых из листа ожидания.
+
+    Возвращает список зачислений, созданных из листа ожидания.
+    """
+    with transaction.atomic(using=router.db_for_write(Enrollment)):
+        today = timezone.localdate()
+        updated = Enrollment.all_branches.filter(pk=enrollment.pk, is_active=True).update(
+            is_active=False,
+            date_left=today,
+        )
+        enrollment.is_active = False
+        enrollment.date_left = today
+        if not updated:
+            return []
+        _release_place(enrollment.group_id)
+        return promote_waitlist(enrollment.group_id)
+
+
+def promote_waitlist(group_id):
+    """Зачисляет студентов из листа ожидания, пока в группе есть места"""
+    promoted = []
+    with transaction.atomic(using=router.db_for_write(WaitlistEntry)):
+        while True:
+            # skip_locked: параллельное продвижение берёт следующих в очереди
+            entry = (
+                WaitlistEntry.objects.select_for_update(skip_locked=True)
+                .filter(group_id=group_id)
+                .order_by('created_at', 'id')
+                .first()
+            )
+            if entry is None:
+                break
+            enrollment, created = _locked_enrollment(entry.student_id, group_id)
+            if enrollment.is_active:
+                entry.delete()
+                continue
+            if not _take_place(group_id):
+                if created:
+                    enrollment.delete()
+                break
+            promoted.append(_activate(enrollment))
+    return promoted
+
+
+def _release_on_commit(group_id):
+    """Освобождает место, лист ожидания продвигается после фиксации транзакции.
+
+    Раньше нельзя: при каскадном удалении студентов или группы очередь
+    в этот момент ещё не вычищена.
+    """
+    _release_place(group_id)
+    transaction.on_commit(lambda: promote_waitlist(group_id))
+
+
+def release_deleted(enrollment):
+    """Освобождает место удалённого активного зачисления"""
+    if enrollment.is_active:
+        _release_on_commit(enrollment.group_id)
+
+
+def sync_saved(enrollment, previous):
+    """Переносит в счётчики мест зачисление, сохранённое напрямую.
+
+    previous - (is_active, group_id) до сохранения, None для новой записи.
+    """
+    was = previous[1] if previous and previous[0] else None
+    now = enrollment.group_id if enrollment.is_active else None
+    if was == now:
+        return
+    if now is not None:
+        Group.all_branches.filter(pk=now).update(active_count=F('active_count') + 1)
+    if was is not None:
+        _release_on_commit(was)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from music_school.archive import archive, archive_cutoff, graduated_students, stale_enrollments
+
+
+class Command(BaseCommand):
+    help = 'Переносит выпускников и давно завершённые зачисления в архивные таблицы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Сколько дней после окончания обучения хранить в рабочих таблицах')
+        parser.add_argument('--batch-size', type=int, help='Записей в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, что будет перенесено')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            cutoff = archive_cutoff(options['days'])
+            self.stdout.write(
+                f"Завершено до {cutoff:%d.%m.%Y}: студентов {graduated_students(cutoff).count()}, "
+                f"зачислений {stale_enrollments(cutoff).count()}"
+            )
+            return
+        students, enrollments = archive(options['days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"В архив перенесено студентов: {students}, отдельных зачислений: {enrollments}"
+        ))
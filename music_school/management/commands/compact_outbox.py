@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from music_school import outbox
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из ленты изменений события, прочитанные всеми потребителями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Событий в одном удалении')
+
+    def handle(self, *args, **options):
+        deleted = outbox.compact(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Удалено событий: {deleted}"))
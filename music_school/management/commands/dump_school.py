@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from music_school.dumps import CHUNK_SIZE, dump
+
+
+class Command(BaseCommand):
+    help = 'Выгружает данные школы в каталог в виде сжатого NDJSON, по файлу на таблицу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог для файлов выгрузки')
+        parser.add_argument('--workers', type=int, default=4, help='Таблиц, выгружаемых параллельно')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Строк в одной выборке')
+        parser.add_argument('--anonymize', action='store_true', help='Заменить имена и телефоны родителей')
+        parser.add_argument('--database', default='default', help='Псевдоним базы данных')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        counts = dump(
+            options['directory'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            anonymize=options['anonymize'],
+            using=options['database'],
+        )
+        for model, count in counts.items():
+            self.stdout.write(f"  {model._meta.label_lower}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Выгружено {sum(counts.values())} строк за {time.monotonic() - started:.1f} с"
+        ))
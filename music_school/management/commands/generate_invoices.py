@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from music_school.billing import BillingInProgress, current_period, generate_invoices, parse_period
+
+
+class Command(BaseCommand):
+    help = 'Формирует счета за месяц по активным зачислениям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', help='Месяц в формате ГГГГ-ММ (по умолчанию текущий)')
+        parser.add_argument('--workers', type=int, help='Количество потоков')
+        parser.add_argument('--chunk-size', type=int, help='Зачислений в одном пакете')
+
+    def handle(self, *args, **options):
+        try:
+            period = parse_period(options['period']) if options['period'] else current_period()
+        except ValueError:
+            raise CommandError('Месяц указывается в формате ГГГГ-ММ')
+
+        def progress(run):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  до зачисления #{run.last_enrollment_id}: {run.invoices_created} счетов")
+
+        try:
+            run = generate_invoices(
+                period,
+                workers=options['workers'],
+                chunk_size=options['chunk_size'],
+                progress=progress,
+            )
+        except BillingInProgress as exc:
+            raise CommandError(exc)
+        throughput = f"{run.throughput:.0f} зачислений/с" if run.throughput else '-'
+        self.stdout.write(self.style.SUCCESS(
+            f"{run}: обработано {run.enrollments_processed}, создано счетов {run.invoices_created}, "
+            f"{run.elapsed_seconds:.1f} с, {throughput}"
+        ))
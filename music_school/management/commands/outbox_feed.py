@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from music_school import outbox
+from music_school.models import OutboxConsumer
+
+
+class Command(BaseCommand):
+    help = 'Выводит ленту изменений после курсора в формате NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after', type=int, help='Курсор: позиция последнего прочитанного события')
+        parser.add_argument('--consumer', help='Потребитель, чья сохранённая позиция используется как курсор')
+        parser.add_argument('--ack', action='store_true', help='Сохранить позицию потребителя после вывода')
+        parser.add_argument('--limit', type=int, default=500, help='Максимум событий')
+
+    def handle(self, *args, **options):
+        if options['ack'] and not options['consumer']:
+            raise CommandError('--ack требует --consumer')
+        if options['limit'] < 1:
+            raise CommandError('--limit должен быть положительным')
+        after = options['after']
+        if after is None:
+            consumer = OutboxConsumer.objects.filter(name=options['consumer']).first() if options['consumer'] else None
+            after = consumer.position if consumer else 0
+
+        events = outbox.fetch(after, options['limit'])
+        for e in events:
+            self.stdout.write(json.dumps({
+                'id': e.pk,
+                'position': e.position,
+                'model': e.model,
+                'object_id': e.object_id,
+                'operation': e.operation,
+                'payload': e.payload,
+                'created_at': e.created_at,
+            }, cls=DjangoJSONEncoder, ensure_ascii=False))
+        if options['ack'] and events:
+            outbox.acknowledge(options['consumer'], events[-1].position)
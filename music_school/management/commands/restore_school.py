@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from music_school.dumps import CHUNK_SIZE, restore
+
+
+class Command(BaseCommand):
+    help = 'Загружает данные школы из каталога, созданного командой dump_school'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог с файлами выгрузки')
+        parser.add_argument('--workers', type=int, default=4, help='Таблиц, загружаемых параллельно (кроме SQLite и --flush)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Строк в одной вставке')
+        parser.add_argument('--flush', action='store_true', help='Очистить таблицы школы перед загрузкой')
+        parser.add_argument('--database', default='default', help='Псевдоним базы данных')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            counts = restore(
+                options['directory'],
+                workers=options['workers'],
+                chunk_size=options['chunk_size'],
+                flush=options['flush'],
+                using=options['database'],
+            )
+        except FileNotFoundError as exc:
+            raise CommandError(exc)
+        for model, count in counts.items():
+            self.stdout.write(f"  {model._meta.label_lower}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Загружено {sum(counts.values())} строк за {time.monotonic() - started:.1f} с"
+        ))
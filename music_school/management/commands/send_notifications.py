@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from music_school import notifications
+from music_school.sms import get_gateway
+
+
+class Command(BaseCommand):
+    help = 'Отправляет родителям уведомления из очереди через SMS-шлюз'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Сообщений в одной пачке (по умолчанию SMS_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно, проверяя очередь')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между проверками очереди, сек')
+
+    def handle(self, *args, **options):
+        try:
+            gateway = get_gateway()
+        except ImproperlyConfigured as exc:
+            raise CommandError(exc)
+        limiter = notifications.RateLimiter(settings.SMS_RATE_PER_SECOND)
+        while True:
+            sent, failed = notifications.dispatch(gateway, batch_size=options['batch_size'], limiter=limiter)
+            if sent or failed or not options['loop']:
+                self.stdout.write(f"Отправлено: {sent}, с ошибкой: {failed}")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,100 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from music_school.enrollment import deactivate, enroll
+from music_school.models import Direction, Enrollment, Group, Student, WaitlistEntry
+
+PREFIX = 'stress-enrollment'
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочная проверка зачисления: множество потоков одновременно записывают '
+        'студентов в одну группу, затем часть отчисляется. Проверяет, что группа '
+        'не переполнена, счётчик мест совпадает с фактом, а лист ожидания продвигается'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=300, help='Количество желающих')
+        parser.add_argument('--capacity', type=int, default=20, help='Вместимость группы')
+        parser.add_argument('--threads', type=int, default=16, help='Параллельных потоков')
+        parser.add_argument('--drop', type=int, default=5, help='Сколько студентов отчислить')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовые данные')
+
+    def handle(self, *args, **options):
+        if options['drop'] > options['capacity']:
+            raise CommandError('--drop не может превышать --capacity')
+
+        direction = Direction.objects.create(name=f'{PREFIX}-{time.time_ns()}', years_of_study=1)
+        try:
+            group = Group.objects.create(
+                direction=direction, year_of_study=1, name=PREFIX,
+                schedule='Пн 10:00-11:00', capacity=options['capacity'],
+            )
+            students = Student.objects.bulk_create([
+                Student(first_name=str(i), last_name=PREFIX, birth_date=date(2015, 1, 1), phone_parent='')
+                for i in range(options['students'])
+            ])
+            self.run(group, students, options)
+        finally:
+            if not options['keep']:
+                Student.objects.filter(last_name=PREFIX).delete()
+                direction.delete()
+
+    def run(self, group, students, options):
+        def enroll_one(student):
+            try:
+                return isinstance(enroll(student, group), Enrollment)
+            finally:
+                connections.close_all()
+
+        def drop_one(enrollment):
+            try:
+                return len(deactivate(enrollment))
+            finally:
+                connections.close_all()
+
+        random.shuffle(students)
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            enrolled = sum(pool.map(enroll_one, students))
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"Зачисление: {len(students)} запросов за {elapsed:.2f} с "
+            f"({len(students) / elapsed:.0f} в секунду), зачислено {enrolled}"
+        )
+        self.verify(group, len(students))
+
+        active = list(Enrollment.objects.filter(group=group, is_active=True))
+        dropped = random.sample(active, options['drop'])
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            promoted = sum(pool.map(drop_one, dropped))
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Отчисление: {len(dropped)} за {elapsed:.2f} с, из листа ожидания зачислено {promoted}")
+        self.verify(group, len(students))
+
+    def verify(self, group, requested):
+        group.refresh_from_db()
+        actual = Enrollment.objects.filter(group=group, is_active=True).count()
+        waiting = WaitlistEntry.objects.filter(group=group).count()
+        expected = min(group.capacity, requested - Enrollment.objects.filter(group=group, is_active=False).count())
+        problems = []
+        if actual > group.capacity:
+            problems.append(f"группа переполнена: {actual} > {group.capacity}")
+        if actual != group.active_count:
+            problems.append(f"счётчик мест {group.active_count} не совпадает с фактом {actual}")
+        if actual != expected:
+            problems.append(f"зачислено {actual}, ожидалось {expected}")
+        if actual + waiting + Enrollment.objects.filter(group=group, is_active=False).count() != requested:
+            problems.append("часть запросов потеряна")
+        if problems:
+            raise CommandError('; '.join(problems))
+        self.stdout.write(self.style.SUCCESS(
+            f"  OK: занято {actual}/{group.capacity}, в листе ожидания {waiting}"
+        ))
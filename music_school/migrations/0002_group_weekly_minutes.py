@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:45
+
+from django.db import migrations, models
+
+from music_school.workload import parse_schedule_minutes
+
+
+def fill_weekly_minutes(apps, schema_editor):
+    Group = apps.get_model('music_school', 'Group')
+    groups = list(Group.objects.only('schedule'))
+    for group in groups:
+        group.weekly_minutes = parse_schedule_minutes(group.schedule)
+    Group.objects.bulk_update(groups, ['weekly_minutes'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='weekly_minutes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Минут в неделю'),
+        ),
+        migrations.RunPython(fill_weekly_minutes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0002_group_weekly_minutes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollment',
+            name='lessons_attended',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Посещено занятий'),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='lessons_marked',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Отмечено занятий'),
+        ),
+        migrations.CreateModel(
+            name='Lesson',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата занятия')),
+                ('marked_count', models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Отмечено')),
+                ('attended_count', models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Присутствовало')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lessons', to='music_school.group', verbose_name='Группа')),
+            ],
+            options={
+                'verbose_name': 'Занятие',
+                'verbose_name_plural': 'Занятия',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Attendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Присутствовал'), (2, 'Опоздал'), (3, 'Отсутствовал'), (4, 'Уважительная причина')], verbose_name='Отметка')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance', to='music_school.student', verbose_name='Студент')),
+                ('lesson', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='attendance', to='music_school.lesson', verbose_name='Занятие')),
+            ],
+            options={
+                'verbose_name': 'Посещение',
+                'verbose_name_plural': 'Посещаемость',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['date'], name='lesson_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='lesson',
+            unique_together={('group', 'date')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='attendance',
+            unique_together={('lesson', 'student')},
+        ),
+    ]
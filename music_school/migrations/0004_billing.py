@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0003_attendance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(unique=True, verbose_name='Расчётный месяц')),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('failed', 'Прервано'), ('done', 'Завершено')], default='running', max_length=10, verbose_name='Статус')),
+                ('last_enrollment_id', models.BigIntegerField(default=0, verbose_name='Последнее обработанное зачисление')),
+                ('enrollments_processed', models.PositiveIntegerField(default=0, verbose_name='Обработано зачислений')),
+                ('invoices_created', models.PositiveIntegerField(default=0, verbose_name='Создано счетов')),
+                ('elapsed_seconds', models.FloatField(default=0, verbose_name='Время расчёта, с')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='Начат')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершён')),
+            ],
+            options={
+                'verbose_name': 'Расчёт оплаты',
+                'verbose_name_plural': 'Расчёты оплаты',
+                'ordering': ['-period'],
+            },
+        ),
+        migrations.AddField(
+            model_name='direction',
+            name='monthly_fee',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Стоимость обучения в месяц'),
+        ),
+        migrations.CreateModel(
+            name='Invoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(verbose_name='Расчётный месяц')),
+                ('description', models.CharField(max_length=255, verbose_name='Назначение')),
+                ('phone_parent', models.CharField(max_length=20, verbose_name='Телефон родителя')),
+                ('base_amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма без скидки')),
+                ('discount', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Скидка')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='К оплате')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('enrollment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='music_school.enrollment', verbose_name='Зачисление')),
+            ],
+            options={
+                'verbose_name': 'Счёт',
+                'verbose_name_plural': 'Счета',
+                'ordering': ['-period', 'id'],
+                'indexes': [models.Index(fields=['period', 'phone_parent'], name='invoice_period_phone_idx')],
+                'unique_together': {('enrollment', 'period')},
+            },
+        ),
+    ]
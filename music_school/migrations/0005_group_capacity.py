@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_active_count(apps, schema_editor):
+    Group = apps.get_model('music_school', 'Group')
+    Enrollment = apps.get_model('music_school', 'Enrollment')
+    counts = dict(
+        Enrollment.objects.filter(is_active=True).order_by()
+        .values('group').annotate(total=models.Count('pk')).values_list('group', 'total')
+    )
+    for group_id, total in counts.items():
+        Group.objects.filter(pk=group_id).update(active_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0004_billing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='active_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Активных студентов'),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='capacity',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Пусто - без ограничения', null=True, verbose_name='Вместимость'),
+        ),
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата записи')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='music_school.group', verbose_name='Группа')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='music_school.student', verbose_name='Студент')),
+            ],
+            options={
+                'verbose_name': 'Лист ожидания',
+                'verbose_name_plural': 'Лист ожидания',
+                'ordering': ['created_at', 'id'],
+                'unique_together': {('group', 'student')},
+            },
+        ),
+        migrations.RunPython(fill_active_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0005_group_capacity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedStudent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True, verbose_name='ID студента')),
+                ('first_name', models.CharField(max_length=50, verbose_name='Имя')),
+                ('last_name', models.CharField(max_length=50, verbose_name='Фамилия')),
+                ('middle_name', models.CharField(blank=True, max_length=50, verbose_name='Отчество')),
+                ('birth_date', models.DateField(verbose_name='Дата рождения')),
+                ('phone_parent', models.CharField(max_length=20, verbose_name='Телефон родителя')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+            ],
+            options={
+                'verbose_name': 'Архивный студент',
+                'verbose_name_plural': 'Архив студентов',
+                'ordering': ['last_name', 'first_name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='date_left',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Дата окончания обучения'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_id', models.BigIntegerField(db_index=True, verbose_name='ID студента')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Присутствовал'), (2, 'Опоздал'), (3, 'Отсутствовал'), (4, 'Уважительная причина')], verbose_name='Отметка')),
+                ('lesson', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='music_school.lesson', verbose_name='Занятие')),
+            ],
+            options={
+                'verbose_name': 'Архивное посещение',
+                'verbose_name_plural': 'Архив посещаемости',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedEnrollment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True, verbose_name='ID зачисления')),
+                ('student_id', models.BigIntegerField(db_index=True, verbose_name='ID студента')),
+                ('group_name', models.CharField(max_length=100, verbose_name='Название группы')),
+                ('date_joined', models.DateField(verbose_name='Дата зачисления')),
+                ('date_left', models.DateField(null=True, verbose_name='Дата окончания обучения')),
+                ('lessons_marked', models.PositiveIntegerField(default=0, verbose_name='Отмечено занятий')),
+                ('lessons_attended', models.PositiveIntegerField(default=0, verbose_name='Посещено занятий')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+                ('group', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='music_school.group', verbose_name='Группа')),
+            ],
+            options={
+                'verbose_name': 'Архивное зачисление',
+                'verbose_name_plural': 'Архив зачислений',
+                'ordering': ['-date_joined'],
+            },
+        ),
+    ]
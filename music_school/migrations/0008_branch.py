@@ -0,0 +1,135 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+SCOPED_MODELS = (
+    'Direction', 'Teacher', 'Student', 'Group', 'Enrollment', 'Lesson', 'Invoice',
+    'ArchivedStudent', 'ArchivedEnrollment',
+)
+
+
+def assign_default_branch(apps, schema_editor):
+    Branch = apps.get_model('music_school', 'Branch')
+    branch, _ = Branch.objects.get_or_create(
+        code=settings.DEFAULT_BRANCH_CODE,
+        defaults={'name': 'Основной филиал'},
+    )
+    for name in SCOPED_MODELS:
+        apps.get_model('music_school', name).objects.filter(branch__isnull=True).update(branch=branch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0007_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Branch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Название филиала')),
+                ('code', models.SlugField(max_length=30, unique=True, verbose_name='Код')),
+                ('database', models.CharField(blank=True, help_text='Псевдоним из settings.DATABASES, если данные филиала вынесены в отдельную БД', max_length=50, verbose_name='База данных')),
+            ],
+            options={
+                'verbose_name': 'Филиал',
+                'verbose_name_plural': 'Филиалы',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='lesson',
+            name='lesson_date_idx',
+        ),
+        migrations.AlterField(
+            model_name='direction',
+            name='name',
+            field=models.CharField(max_length=100, verbose_name='Название направления'),
+        ),
+        migrations.AddField(
+            model_name='archivedenrollment',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AddField(
+            model_name='archivedstudent',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AddField(
+            model_name='direction',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AddField(
+            model_name='teacher',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedenrollment',
+            index=models.Index(fields=['branch', 'date_joined'], name='archenroll_branch_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedstudent',
+            index=models.Index(fields=['branch', 'last_name', 'first_name'], name='archstudent_branch_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['branch', 'is_active'], name='enrollment_branch_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['branch', 'direction', 'year_of_study'], name='group_branch_direction_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['branch', 'period'], name='invoice_branch_period_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['branch', 'date'], name='lesson_branch_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['branch', 'last_name', 'first_name'], name='student_branch_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teacher',
+            index=models.Index(fields=['branch', 'last_name', 'first_name'], name='teacher_branch_name_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='direction',
+            constraint=models.UniqueConstraint(fields=('branch', 'name'), name='direction_branch_name_uniq'),
+        ),
+        migrations.RunPython(assign_default_branch, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0008_branch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedenrollment',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AlterField(
+            model_name='archivedstudent',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AlterField(
+            model_name='direction',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AlterField(
+            model_name='enrollment',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AlterField(
+            model_name='group',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AlterField(
+            model_name='lesson',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+        migrations.AlterField(
+            model_name='teacher',
+            name='branch',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0009_branch_required'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('schedule', 'Изменение расписания'), ('cancel', 'Отмена занятия'), ('announce', 'Объявление')], default='announce', max_length=10, verbose_name='Тип')),
+                ('text', models.TextField(verbose_name='Текст сообщения')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('branch', models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='music_school.branch', verbose_name='Филиал')),
+                ('group', models.ForeignKey(blank=True, help_text='Пусто - всем родителям филиала', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='music_school.group', verbose_name='Группа')),
+            ],
+            options={
+                'verbose_name': 'Уведомление',
+                'verbose_name_plural': 'Уведомления',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='NotificationDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone', models.CharField(max_length=20, verbose_name='Телефон')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('sent', 'Отправлено'), ('failed', 'Не доставлено')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(auto_now_add=True, verbose_name='Следующая попытка')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('gateway_message_id', models.CharField(blank=True, max_length=100, verbose_name='ID в SMS-шлюзе')),
+                ('last_error', models.CharField(blank=True, max_length=255, verbose_name='Ошибка')),
+                ('notification', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='music_school.notification', verbose_name='Уведомление')),
+            ],
+            options={
+                'verbose_name': 'Доставка уведомления',
+                'verbose_name_plural': 'Доставки уведомлений',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['branch', 'created_at'], name='notification_branch_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationdelivery',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='delivery_queue_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='notificationdelivery',
+            unique_together={('notification', 'phone')},
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+def recount_active_count(apps, schema_editor):
+    # Зачисления, созданные в обход music_school.enrollment, счётчик не меняли
+    Group = apps.get_model('music_school', 'Group')
+    Enrollment = apps.get_model('music_school', 'Enrollment')
+    counts = dict(
+        Enrollment.objects.filter(is_active=True).order_by()
+        .values('group').annotate(total=models.Count('pk')).values_list('group', 'total')
+    )
+    for group in Group.objects.only('pk', 'active_count'):
+        total = counts.get(group.pk, 0)
+        if group.active_count != total:
+            Group.objects.filter(pk=group.pk).update(active_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0010_notifications'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_active_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:11
+
+from django.db import migrations, models
+
+
+def fill_positions(apps, schema_editor):
+    # Существующие события давно зафиксированы, а сохранённые курсоры
+    # потребителей - это их id, поэтому позиция совпадает с id
+    OutboxEvent = apps.get_model('music_school', 'OutboxEvent')
+    OutboxEvent.objects.update(position=models.F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0011_recount_active_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='position',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, unique=True, verbose_name='Позиция в ленте'),
+        ),
+        migrations.AlterField(
+            model_name='outboxconsumer',
+            name='position',
+            field=models.BigIntegerField(default=0, verbose_name='Последняя прочитанная позиция'),
+        ),
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from music_school.workload import parse_schedule_minutes
+
+
+def recount_weekly_minutes(apps, schema_editor):
+    # Разбор расписания исправлен: пересчитываем сохранённую нагрузку групп
+    Group = apps.get_model('music_school', 'Group')
+    groups = list(Group.objects.using(schema_editor.connection.alias).only('schedule', 'weekly_minutes'))
+    changed = []
+    for group in groups:
+        minutes = parse_schedule_minutes(group.schedule)
+        if group.weekly_minutes != minutes:
+            group.weekly_minutes = minutes
+            changed.append(group)
+    Group.objects.using(schema_editor.connection.alias).bulk_update(changed, ['weekly_minutes'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0012_outbox_position'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_weekly_minutes, migrations.RunPython.noop),
+    ]
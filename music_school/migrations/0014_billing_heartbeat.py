@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0013_recount_weekly_minutes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billingrun',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последний прогресс'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_school', '0014_billing_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billingrun',
+            name='database',
+            field=models.CharField(default='default', max_length=50, verbose_name='Текущая база'),
+        ),
+    ]
@@ -1,10 +1,64 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
-class Direction(models.Model):
+from .branches import BranchManager, BranchQuerySet, default_branch, get_current_branch
+from .outbox import OutboxQuerySet
+from .workload import parse_schedule_minutes
+
+class Branch(models.Model):
+    name = models.CharField(max_length=100, unique=True, verbose_name='Название филиала')
+    code = models.SlugField(max_length=30, unique=True, verbose_name='Код')
+    database = models.CharField(
+        max_length=50,
+        blank=True,
+        verbose_name='База данных',
+        help_text='Псевдоним из settings.DATABASES, если данные филиала вынесены в отдельную БД'
+    )
+    
+    class Meta:
+        verbose_name = 'Филиал'
+        verbose_name_plural = 'Филиалы'
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+
+class BranchScopedModel(models.Model):
+    """Данные, принадлежащие филиалу.
+
+    Отдельный индекс по branch не создаётся: у каждой модели есть
+    составной индекс, начинающийся с branch.
+    """
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.PROTECT,
+        editable=False,
+        db_index=False,
+        verbose_name='Филиал'
+    )
+    
+    objects = BranchManager.from_queryset(BranchQuerySet)()
+    all_branches = BranchQuerySet.as_manager()
+    
+    class Meta:
+        abstract = True
+    
+    def resolve_branch(self):
+        """Филиал новой записи: текущий или филиал по умолчанию"""
+        return get_current_branch() or default_branch()
+    
+    def save(self, *args, **kwargs):
+        if self.branch_id is None:
+            self.branch = self.resolve_branch()
+        super().save(*args, **kwargs)
+
+# Менеджеры моделей, изменения которых попадают в ленту outbox
+ScopedOutboxManager = BranchManager.from_queryset(OutboxQuerySet)
+
+class Direction(BranchScopedModel):
     name = models.CharField(
         max_length=100, 
-        verbose_name='Название направления',
-        unique=True
+        verbose_name='Название направления'
     )
     years_of_study = models.PositiveSmallIntegerField(
         verbose_name='Количество лет обучения'
@@ -13,16 +67,28 @@ class Direction(models.Model):
         blank=True, 
         verbose_name='Описание направления'
     )
+    monthly_fee = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        verbose_name='Стоимость обучения в месяц'
+    )
+    
+    objects = ScopedOutboxManager()
+    all_branches = OutboxQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Направление'
         verbose_name_plural = 'Направления'
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'name'], name='direction_branch_name_uniq'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.years_of_study} год(а))"
     
-class Teacher(models.Model):
+class Teacher(BranchScopedModel):
     first_name = models.CharField(max_length=50, verbose_name='Имя')
     last_name = models.CharField(max_length=50, verbose_name='Фамилия')
     middle_name = models.CharField(
@@ -37,10 +103,14 @@ class Teacher(models.Model):
     )
     is_active = models.BooleanField(default=True, verbose_name='Преподаёт')
     
+    objects = ScopedOutboxManager()
+    all_branches = OutboxQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Преподаватель'
         verbose_name_plural = 'Преподаватели'
         ordering = ['last_name', 'first_name']
+        indexes = [models.Index(fields=['branch', 'last_name', 'first_name'], name='teacher_branch_name_idx')]
     
     def __str__(self):
         return f"{self.last_name} {self.first_name[0]}.{self.middle_name[0] + '.' if self.middle_name else ''}"
@@ -51,7 +121,7 @@ class Teacher(models.Model):
             return f"{self.last_name} {self.first_name} {self.middle_name}"
         return f"{self.last_name} {self.first_name}"
     
-class Student(models.Model):
+class Student(BranchScopedModel):
     first_name = models.CharField(max_length=50, verbose_name='Имя')
     last_name = models.CharField(max_length=50, verbose_name='Фамилия')
     middle_name = models.CharField(
@@ -65,10 +135,14 @@ class Student(models.Model):
         verbose_name='Телефон родителя'
     )
     
+    objects = ScopedOutboxManager()
+    all_branches = OutboxQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Студент'
         verbose_name_plural = 'Студенты'
         ordering = ['last_name', 'first_name']
+        indexes = [models.Index(fields=['branch', 'last_name', 'first_name'], name='student_branch_name_idx')]
     
     def __str__(self):
         return f"{self.last_name} {self.first_name}"
@@ -85,7 +159,7 @@ class Student(models.Model):
         today = date.today()
         return today.year - self.birth_date.year - ((today.month, today.day) < (self.birth_date.month, self.birth_date.day))
     
-class Group(models.Model):
+class Group(BranchScopedModel):
     direction = models.ForeignKey(
         Direction,
         on_delete=models.CASCADE,
@@ -109,23 +183,64 @@ class Group(models.Model):
     )
     name = models.CharField(max_length=100, verbose_name='Название группы')
     schedule = models.CharField(max_length=200, verbose_name='Расписание')
+    weekly_minutes = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Минут в неделю'
+    )
+    capacity = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Вместимость',
+        help_text='Пусто - без ограничения'
+    )
+    # Меняется атомарными UPDATE из music_school.enrollment (в т.ч. по сигналам сохранения зачислений)
+    active_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Активных студентов'
+    )
+    
+    objects = ScopedOutboxManager()
+    all_branches = OutboxQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Группа'
         verbose_name_plural = 'Группы'
         ordering = ['direction', 'year_of_study', 'name']
         unique_together = ['direction', 'year_of_study', 'name']
+        indexes = [models.Index(fields=['branch', 'direction', 'year_of_study'], name='group_branch_direction_idx')]
     
     def __str__(self):
         return f"{self.name} ({self.direction.name}, {self.year_of_study} год)"
     
+    def resolve_branch(self):
+        return self.direction.branch
+    
     def save(self, *args, **kwargs):
         # Валидация: год обучения не может превышать общее количество лет по направлению
         if self.year_of_study > self.direction.years_of_study:
             raise ValueError("Год обучения не может превышать общее количество лет по направлению")
+        # Нагрузка хранится вместе с группой, чтобы сортировать и суммировать её в БД
+        self.weekly_minutes = parse_schedule_minutes(self.schedule)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'schedule' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'weekly_minutes'}
+        elif update_fields is None and not self._state.adding:
+            # Не перезаписываем счётчик мест значением из устаревшего экземпляра
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'active_count'
+            ]
         super().save(*args, **kwargs)
+    
+    @property
+    def free_places(self):
+        if self.capacity is None:
+            return None
+        return max(self.capacity - self.active_count, 0)
 
-class Enrollment(models.Model):
+class Enrollment(BranchScopedModel):
     student = models.ForeignKey(
         Student, 
         on_delete=models.CASCADE,
@@ -144,13 +259,396 @@ class Enrollment(models.Model):
         default=True,
         verbose_name='Активное обучение'
     )
+    date_left = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Дата окончания обучения'
+    )
+    # Счётчики посещаемости обновляются при отметке, чтобы не сканировать Attendance
+    lessons_marked = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Отмечено занятий'
+    )
+    lessons_attended = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Посещено занятий'
+    )
+    
+    objects = ScopedOutboxManager()
+    all_branches = OutboxQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Зачисление'
         verbose_name_plural = 'Зачисления'
         unique_together = ['student', 'group']
+        indexes = [models.Index(fields=['branch', 'is_active'], name='enrollment_branch_active_idx')]
     
     def __str__(self):
         status = "активно" if self.is_active else "неактивно"
         return f"{self.student} -> {self.group} ({status})"
     
+    def resolve_branch(self):
+        return self.group.branch
+    
+    @property
+    def attendance_rate(self):
+        if not self.lessons_marked:
+            return None
+        return self.lessons_attended / self.lessons_marked
+
+class WaitlistEntry(models.Model):
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        related_name='waitlist',
+        verbose_name='Группа'
+    )
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.CASCADE,
+        related_name='waitlist',
+        verbose_name='Студент'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата записи')
+    
+    class Meta:
+        verbose_name = 'Лист ожидания'
+        verbose_name_plural = 'Лист ожидания'
+        ordering = ['created_at', 'id']
+        unique_together = ['group', 'student']
+    
+    def __str__(self):
+        return f"{self.student} -> {self.group} (ожидание)"
+
+class Lesson(BranchScopedModel):
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        related_name='lessons',
+        verbose_name='Группа'
+    )
+    date = models.DateField(verbose_name='Дата занятия')
+    marked_count = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Отмечено'
+    )
+    attended_count = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Присутствовало'
+    )
+    
+    class Meta:
+        verbose_name = 'Занятие'
+        verbose_name_plural = 'Занятия'
+        ordering = ['-date']
+        unique_together = ['group', 'date']
+        indexes = [models.Index(fields=['branch', 'date'], name='lesson_branch_date_idx')]
+    
+    def __str__(self):
+        return f"{self.group.name} {self.date:%d.%m.%Y}"
+    
+    def resolve_branch(self):
+        return self.group.branch
+
+class Attendance(models.Model):
+    class Status(models.IntegerChoices):
+        PRESENT = 1, 'Присутствовал'
+        LATE = 2, 'Опоздал'
+        ABSENT = 3, 'Отсутствовал'
+        EXCUSED = 4, 'Уважительная причина'
+    
+    ATTENDED = (Status.PRESENT, Status.LATE)
+    
+    # Отдельный индекс по lesson не нужен: его покрывает unique (lesson, student)
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        related_name='attendance',
+        db_index=False,
+        verbose_name='Занятие'
+    )
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.CASCADE,
+        related_name='attendance',
+        verbose_name='Студент'
+    )
+    status = models.PositiveSmallIntegerField(
+        choices=Status.choices,
+        verbose_name='Отметка'
+    )
+    
+    class Meta:
+        verbose_name = 'Посещение'
+        verbose_name_plural = 'Посещаемость'
+        unique_together = ['lesson', 'student']
+    
+    def __str__(self):
+        return f"{self.student} - {self.lesson} ({self.get_status_display()})"
+    
+
+class BillingRun(models.Model):
+    class Status(models.TextChoices):
+        RUNNING = 'running', 'Выполняется'
+        FAILED = 'failed', 'Прервано'
+        DONE = 'done', 'Завершено'
+    
+    period = models.DateField(unique=True, verbose_name='Расчётный месяц')
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.RUNNING,
+        verbose_name='Статус'
+    )
+    # Базы школы обходятся по очереди; курсор last_enrollment_id относится к этой базе
+    database = models.CharField(max_length=50, default='default', verbose_name='Текущая база')
+    # Все зачисления с id не больше этого уже обработаны: с него продолжается прерванный расчёт
+    last_enrollment_id = models.BigIntegerField(default=0, verbose_name='Последнее обработанное зачисление')
+    enrollments_processed = models.PositiveIntegerField(default=0, verbose_name='Обработано зачислений')
+    invoices_created = models.PositiveIntegerField(default=0, verbose_name='Создано счетов')
+    elapsed_seconds = models.FloatField(default=0, verbose_name='Время расчёта, с')
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name='Начат')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершён')
+    # Обновляется после каждого пакета; пока он свежий, второй расчёт того же месяца не запускается
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name='Последний прогресс')
+    
+    class Meta:
+        verbose_name = 'Расчёт оплаты'
+        verbose_name_plural = 'Расчёты оплаты'
+        ordering = ['-period']
+    
+    def __str__(self):
+        return f"Расчёт за {self.period:%m.%Y} ({self.get_status_display()})"
+    
+    @property
+    def throughput(self):
+        if not self.elapsed_seconds:
+            return None
+        return self.enrollments_processed / self.elapsed_seconds
+
+class Invoice(BranchScopedModel):
+    # Счёт сохраняется и после удаления или архивации зачисления
+    enrollment = models.ForeignKey(
+        Enrollment,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='invoices',
+        verbose_name='Зачисление'
+    )
+    period = models.DateField(verbose_name='Расчётный месяц')
+    description = models.CharField(max_length=255, verbose_name='Назначение')
+    phone_parent = models.CharField(max_length=20, verbose_name='Телефон родителя')
+    base_amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Сумма без скидки')
+    discount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        verbose_name='Скидка'
+    )
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='К оплате')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
+    
+    class Meta:
+        verbose_name = 'Счёт'
+        verbose_name_plural = 'Счета'
+        ordering = ['-period', 'id']
+        unique_together = ['enrollment', 'period']
+        indexes = [
+            models.Index(fields=['branch', 'period'], name='invoice_branch_period_idx'),
+            models.Index(fields=['period', 'phone_parent'], name='invoice_period_phone_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.description} за {self.period:%m.%Y}: {self.amount}"
+    
+    def resolve_branch(self):
+        if self.enrollment_id:
+            return self.enrollment.branch
+        return super().resolve_branch()
+
+# Архив: записи переносятся сюда из рабочих таблиц командой archive_school
+class ArchivedStudent(BranchScopedModel):
+    original_id = models.BigIntegerField(unique=True, verbose_name='ID студента')
+    first_name = models.CharField(max_length=50, verbose_name='Имя')
+    last_name = models.CharField(max_length=50, verbose_name='Фамилия')
+    middle_name = models.CharField(max_length=50, blank=True, verbose_name='Отчество')
+    birth_date = models.DateField(verbose_name='Дата рождения')
+    phone_parent = models.CharField(max_length=20, verbose_name='Телефон родителя')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')
+    
+    class Meta:
+        verbose_name = 'Архивный студент'
+        verbose_name_plural = 'Архив студентов'
+        ordering = ['last_name', 'first_name']
+        indexes = [models.Index(fields=['branch', 'last_name', 'first_name'], name='archstudent_branch_name_idx')]
+    
+    def __str__(self):
+        return f"{self.last_name} {self.first_name}"
+
+class ArchivedEnrollment(BranchScopedModel):
+    original_id = models.BigIntegerField(unique=True, verbose_name='ID зачисления')
+    # id студента: рабочего или архивного (ArchivedStudent.original_id)
+    student_id = models.BigIntegerField(db_index=True, verbose_name='ID студента')
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name='Группа'
+    )
+    group_name = models.CharField(max_length=100, verbose_name='Название группы')
+    date_joined = models.DateField(verbose_name='Дата зачисления')
+    date_left = models.DateField(null=True, verbose_name='Дата окончания обучения')
+    lessons_marked = models.PositiveIntegerField(default=0, verbose_name='Отмечено занятий')
+    lessons_attended = models.PositiveIntegerField(default=0, verbose_name='Посещено занятий')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')
+    
+    class Meta:
+        verbose_name = 'Архивное зачисление'
+        verbose_name_plural = 'Архив зачислений'
+        ordering = ['-date_joined']
+        indexes = [models.Index(fields=['branch', 'date_joined'], name='archenroll_branch_date_idx')]
+    
+    def __str__(self):
+        return f"#{self.student_id} -> {self.group_name} ({self.date_joined:%d.%m.%Y})"
+
+class ArchivedAttendance(models.Model):
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False,
+        verbose_name='Занятие'
+    )
+    student_id = models.BigIntegerField(db_index=True, verbose_name='ID студента')
+    status = models.PositiveSmallIntegerField(
+        choices=Attendance.Status.choices,
+        verbose_name='Отметка'
+    )
+    
+    class Meta:
+        verbose_name = 'Архивное посещение'
+        verbose_name_plural = 'Архив посещаемости'
+
+class OutboxEvent(models.Model):
+    class Operation(models.TextChoices):
+        INSERT = 'insert', 'Создание'
+        UPDATE = 'update', 'Изменение'
+        DELETE = 'delete', 'Удаление'
+    
+    model = models.CharField(max_length=64, verbose_name='Модель')
+    object_id = models.CharField(max_length=64, verbose_name='ID объекта')
+    operation = models.CharField(max_length=6, choices=Operation.choices, verbose_name='Операция')
+    payload = models.JSONField(encoder=DjangoJSONEncoder, verbose_name='Данные')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Время изменения')
+    # Курсор ленты: выдаётся после фиксации транзакции (outbox.assign_positions), а не при вставке
+    position = models.BigIntegerField(
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        verbose_name='Позиция в ленте'
+    )
+    
+    class Meta:
+        verbose_name = 'Событие изменения'
+        verbose_name_plural = 'Лента изменений'
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"#{self.position or '-'} {self.get_operation_display()} {self.model} {self.object_id}"
+
+class OutboxConsumer(models.Model):
+    name = models.CharField(max_length=100, unique=True, verbose_name='Потребитель')
+    position = models.BigIntegerField(default=0, verbose_name='Последняя прочитанная позиция')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+    
+    class Meta:
+        verbose_name = 'Потребитель ленты'
+        verbose_name_plural = 'Потребители ленты'
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} (#{self.position})"
+
+class Notification(BranchScopedModel):
+    class Kind(models.TextChoices):
+        SCHEDULE_CHANGE = 'schedule', 'Изменение расписания'
+        CANCELLATION = 'cancel', 'Отмена занятия'
+        ANNOUNCEMENT = 'announce', 'Объявление'
+    
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='notifications',
+        verbose_name='Группа',
+        help_text='Пусто - всем родителям филиала'
+    )
+    kind = models.CharField(
+        max_length=10,
+        choices=Kind.choices,
+        default=Kind.ANNOUNCEMENT,
+        verbose_name='Тип'
+    )
+    text = models.TextField(verbose_name='Текст сообщения')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['branch', 'created_at'], name='notification_branch_date_idx')]
+    
+    def __str__(self):
+        target = self.group.name if self.group else 'все группы'
+        return f"{self.get_kind_display()}: {target} ({self.created_at:%d.%m.%Y %H:%M})"
+    
+    def resolve_branch(self):
+        if self.group_id:
+            return self.group.branch
+        return super().resolve_branch()
+
+class NotificationDelivery(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        SENT = 'sent', 'Отправлено'
+        FAILED = 'failed', 'Не доставлено'
+    
+    # Отдельный индекс по notification не нужен: его покрывает unique (notification, phone)
+    notification = models.ForeignKey(
+        Notification,
+        on_delete=models.CASCADE,
+        related_name='deliveries',
+        db_index=False,
+        verbose_name='Уведомление'
+    )
+    # Нормализованный номер: братья и сёстры получают одно сообщение
+    phone = models.CharField(max_length=20, verbose_name='Телефон')
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(auto_now_add=True, verbose_name='Следующая попытка')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+    gateway_message_id = models.CharField(max_length=100, blank=True, verbose_name='ID в SMS-шлюзе')
+    last_error = models.CharField(max_length=255, blank=True, verbose_name='Ошибка')
+    
+    class Meta:
+        verbose_name = 'Доставка уведомления'
+        verbose_name_plural = 'Доставки уведомлений'
+        unique_together = ['notification', 'phone']
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='delivery_queue_idx')]
+    
+    def __str__(self):
+        return f"{self.phone}: {self.get_status_display()}"
@@ -0,0 +1,160 @@
+"""Очередь уведомлений родителей и её отправка через SMS-шлюз.
+
+Уведомление раскладывается на доставки по нормализованным телефонам
+родителей, поэтому семья с несколькими детьми в группе получает одно
+сообщение. Отправляет очередь отдельный процесс (команда
+send_notifications): доставки забираются пачками, скорость ограничена
+SMS_RATE_PER_SECOND, неудачные попытки повторяются с растущей паузой.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .branches import school_databases, use_database
+from .models import Enrollment, Notification, NotificationDelivery
+from .sms import SendResult, get_gateway
+from .utils import normalize_phone
+
+
+def recipients(notification):
+    """Нормализованные телефоны родителей активных студентов без повторов"""
+    enrollments = Enrollment.all_branches.filter(is_active=True)
+    if notification.group_id:
+        enrollments = enrollments.filter(group_id=notification.group_id)
+    else:
+        enrollments = enrollments.filter(branch_id=notification.branch_id)
+    phones = enrollments.order_by().values_list('student__phone_parent', flat=True).distinct()
+    return sorted({normalize_phone(phone) for phone in phones if phone} - {''})
+
+
+def enqueue(notification):
+    """Ставит доставки уведомления в очередь. Возвращает количество новых"""
+    queued = notification.deliveries.count()
+    deliveries = [
+        NotificationDelivery(notification=notification, phone=phone)
+        for phone in recipients(notification)
+    ]
+    # ignore_conflicts делает повторную постановку безопасной
+    NotificationDelivery.objects.bulk_create(deliveries, batch_size=1000, ignore_conflicts=True)
+    return notification.deliveries.count() - queued
+
+
+def notify(text, kind=Notification.Kind.ANNOUNCEMENT, group=None):
+    """Создаёт уведомление группе (или всему филиалу) и ставит его в очередь"""
+    with transaction.atomic(using=router.db_for_write(Notification)):
+        notification = Notification.objects.create(text=text, kind=kind, group=group)
+        enqueue(notification)
+    return notification
+
+
+def delivery_stats(notification):
+    """Количество доставок уведомления по статусам"""
+    rows = notification.deliveries.order_by().values('status').annotate(count=Count('pk'))
+    return {row['status']: row['count'] for row in rows}
+
+
+class RateLimiter:
+    """Ограничение скорости по алгоритму token bucket"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def acquire(self, count=1):
+        # Больше capacity токенов за раз в ведре не бывает, поэтому берём частями
+        while count > 0:
+            part = min(count, self.capacity)
+            self._take(part)
+            count -= part
+
+    def _take(self, count):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= count:
+                self.tokens -= count
+                return
+            time.sleep((count - self.tokens) / self.rate)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=settings.SMS_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def _claim(batch_size):
+    """Забирает пачку доставок, готовых к отправке.
+
+    Доставка получает аренду на SMS_LEASE_SECONDS: параллельные процессы
+    её не возьмут, а если процесс упадёт до записи результата, доставка
+    вернётся в очередь по истечении аренды.
+    """
+    now = timezone.now()
+    with transaction.atomic(using=router.db_for_write(NotificationDelivery)):
+        ids = list(
+            NotificationDelivery.objects.select_for_update(skip_locked=True)
+            .filter(status=NotificationDelivery.Status.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        NotificationDelivery.objects.filter(pk__in=ids).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + timedelta(seconds=settings.SMS_LEASE_SECONDS),
+        )
+    return list(NotificationDelivery.objects.filter(pk__in=ids).select_related('notification'))
+
+
+def _apply_results(deliveries, results):
+    now = timezone.now()
+    for delivery, result in zip(deliveries, results):
+        if result.ok:
+            delivery.status = NotificationDelivery.Status.SENT
+            delivery.sent_at = now
+            delivery.gateway_message_id = result.message_id
+            delivery.last_error = ''
+        else:
+            delivery.last_error = result.error[:255]
+            if delivery.attempts >= settings.SMS_MAX_ATTEMPTS:
+                delivery.status = NotificationDelivery.Status.FAILED
+            else:
+                delivery.next_attempt_at = now + retry_delay(delivery.attempts)
+    NotificationDelivery.objects.bulk_update(
+        deliveries, ['status', 'sent_at', 'gateway_message_id', 'last_error', 'next_attempt_at'],
+    )
+
+
+def dispatch(gateway=None, batch_size=None, limiter=None, max_batches=None):
+    """Отправляет очередь, пока в ней есть готовые доставки.
+
+    Очереди баз школы (основной и отдельных баз филиалов) отправляются
+    по очереди с общим ограничением скорости. Возвращает (отправлено,
+    не удалось в этот раз).
+    """
+    gateway = gateway or get_gateway()
+    batch_size = batch_size or settings.SMS_BATCH_SIZE
+    limiter = limiter or RateLimiter(settings.SMS_RATE_PER_SECOND)
+    sent = failed = batches = 0
+    for database in school_databases():
+        with use_database(database):
+            while max_batches is None or batches < max_batches:
+                deliveries = _claim(batch_size)
+                if not deliveries:
+                    break
+                batches += 1
+                limiter.acquire(len(deliveries))
+                messages = [(d.phone, d.notification.text) for d in deliveries]
+                try:
+                    results = gateway.send_batch(messages)
+                except Exception as exc:
+                    results = [SendResult(ok=False, error=str(exc) or exc.__class__.__name__)] * len(deliveries)
+                _apply_results(deliveries, results)
+                ok = sum(1 for result in results if result.ok)
+                sent += ok
+                failed += len(deliveries) - ok
+    return sent, failed
@@ -0,0 +1,158 @@
+"""Транзакционная лента изменений (outbox) для внешних систем.
+
+События пишутся в ту же транзакцию, что и само изменение: одиночные
+save/delete ловятся сигналами (см. signals.py), массовые bulk_create,
+bulk_update и update - через OutboxQuerySet. Потребители читают ленту
+по курсору (позиции события) и подтверждают прочитанную позицию;
+события, прочитанные всеми потребителями, удаляются при уплотнении.
+
+Курсором служит не id, а позиция, которую событие получает уже после
+фиксации своей транзакции: id выдаются при вставке, и долгая транзакция
+может зафиксировать события с id меньше уже прочитанного курсора.
+"""
+from django.apps import apps
+from django.db import IntegrityError, models, transaction
+from django.db.models import Max, Min
+
+from .branches import BranchQuerySet
+
+# Служебные счётчики меняются постоянно и не интересны внешним системам
+IGNORED_FIELDS = {
+    'music_school.group': {'active_count'},
+    'music_school.enrollment': {'lessons_marked', 'lessons_attended'},
+}
+
+
+def _event_model():
+    return apps.get_model('music_school', 'OutboxEvent')
+
+
+def is_ignored(model, fields):
+    """True, если изменены только служебные поля"""
+    ignored = IGNORED_FIELDS.get(model._meta.label_lower, set())
+    return fields is not None and bool(fields) and set(fields) <= ignored
+
+
+def serialize(obj):
+    return {f.attname: f.value_from_object(obj) for f in obj._meta.concrete_fields}
+
+
+def record(objs, operation):
+    """Записывает события для списка объектов одной модели"""
+    OutboxEvent = _event_model()
+    OutboxEvent.objects.bulk_create(
+        [
+            OutboxEvent(
+                model=obj._meta.label_lower,
+                object_id=str(obj.pk),
+                operation=operation,
+                payload=serialize(obj),
+            )
+            for obj in objs
+        ],
+        batch_size=1000,
+    )
+
+
+def record_pairs(through, pairs, operation):
+    """Записывает события промежуточной таблицы M2M (например, Teacher.directions)"""
+    OutboxEvent = _event_model()
+    source, target = [f.attname for f in through._meta.local_concrete_fields if f.is_relation]
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(
+            model=through._meta.label_lower,
+            object_id=f'{source_id}:{target_id}',
+            operation=operation,
+            payload={source: source_id, target: target_id},
+        )
+        for source_id, target_id in pairs
+    ])
+
+
+class OutboxQuerySet(BranchQuerySet):
+    """QuerySet, который пишет события и для массовых операций"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            # При ignore_conflicts база не возвращает id: такие строки не попадут в ленту
+            record([obj for obj in objs if obj.pk is not None], 'insert')
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            if not is_ignored(self.model, fields):
+                record(objs, 'update')
+        return rows
+
+    def update(self, **kwargs):
+        if is_ignored(self.model, kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            pks = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            changed = self.model._base_manager.using(self.db).filter(pk__in=pks)
+            record(changed.iterator(), 'update')
+        return rows
+
+
+def assign_positions(batch_size=10000):
+    """Выдаёт позиции зафиксированным событиям, у которых их ещё нет.
+
+    Видны только зафиксированные события, поэтому позиции идут в порядке
+    фиксации: событие поздно зафиксированной транзакции получит позицию
+    после всех уже выданных и не будет пропущено потребителем. Если
+    параллельный вызов успел выдать те же позиции, этот откатывается по
+    unique - события получат позиции при следующем чтении. Возвращает
+    количество событий, получивших позицию.
+    """
+    OutboxEvent = _event_model()
+    try:
+        with transaction.atomic():
+            # Сначала последняя позиция, затем события: так гонка с параллельным
+            # вызовом всегда заканчивается конфликтом unique, а не перестановкой
+            last = OutboxEvent.objects.aggregate(last=Max('position'))['last'] or 0
+            ids = list(
+                OutboxEvent.objects.filter(position__isnull=True)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            OutboxEvent.objects.bulk_update(
+                [OutboxEvent(pk=pk, position=last + i) for i, pk in enumerate(ids, 1)],
+                ['position'],
+                batch_size=1000,
+            )
+    except IntegrityError:
+        return 0
+    return len(ids)
+
+
+def fetch(after=0, limit=500):
+    """События с позицией больше курсора after"""
+    assign_positions()
+    return list(_event_model().objects.filter(position__gt=after).order_by('position')[:limit])
+
+
+def acknowledge(consumer, position):
+    """Сохраняет позицию потребителя (только вперёд)"""
+    OutboxConsumer = apps.get_model('music_school', 'OutboxConsumer')
+    consumer, _ = OutboxConsumer.objects.get_or_create(name=consumer)
+    OutboxConsumer.objects.filter(pk=consumer.pk, position__lt=position).update(position=position)
+    consumer.refresh_from_db()
+    return consumer
+
+
+def compact(batch_size=10000):
+    """Удаляет события, прочитанные всеми потребителями. Возвращает количество"""
+    OutboxConsumer = apps.get_model('music_school', 'OutboxConsumer')
+    OutboxEvent = _event_model()
+    position = OutboxConsumer.objects.aggregate(position=Min('position'))['position']
+    if not position:
+        return 0
+    total = 0
+    while True:
+        ids = list(OutboxEvent.objects.filter(position__lte=position).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+        deleted, _ = OutboxEvent.objects.filter(pk__in=ids).delete()
+        total += deleted
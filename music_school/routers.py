@@ -0,0 +1,49 @@
+from django.conf import settings
+
+from .branches import get_current_branch, get_current_database
+
+# Общие для всей школы таблицы всегда остаются в основной базе
+SHARED_MODELS = {
+    'music_school.branch',
+    'music_school.billingrun',
+    'music_school.outboxevent',
+    'music_school.outboxconsumer',
+}
+
+
+class BranchRouter:
+    """Направляет запросы к данным филиала в его отдельную базу.
+
+    Используется, только если у текущего филиала задано поле database и
+    такой псевдоним есть в settings.DATABASES, либо если база выбрана
+    явно через use_database (задачи по всей школе). В базу филиала идут все
+    таблицы приложения, кроме SHARED_MODELS, в том числе таблицы без
+    собственного поля branch (посещаемость, лист ожидания), чтобы внешние
+    ключи не пересекали границу баз. Схема в отдельной базе создаётся
+    обычным migrate --database, а строки Branch должны быть скопированы
+    туда (например, restore_school --database). Лента outbox остаётся
+    в основной базе и для таких филиалов не транзакционна.
+    """
+
+    def _branch_database(self, model):
+        if model._meta.app_label != 'music_school' or model._meta.label_lower in SHARED_MODELS:
+            return None
+        database = get_current_database()
+        if database is not None:
+            return database
+        branch = get_current_branch()
+        if branch is not None and branch.database in settings.DATABASES:
+            return branch.database
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._branch_database(model)
+
+    def db_for_write(self, model, **hints):
+        return self._branch_database(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Строки Branch читаются из основной базы, но есть и в каждой базе филиала
+        if 'music_school.branch' in (obj1._meta.label_lower, obj2._meta.label_lower):
+            return True
+        return None
@@ -0,0 +1,73 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import outbox
+from .enrollment import release_deleted, sync_saved
+from .models import Direction, Enrollment, Group, Student, Teacher
+
+OUTBOX_MODELS = (Direction, Teacher, Student, Group, Enrollment)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    release_deleted(instance)
+
+
+@receiver(pre_save, sender=Enrollment)
+def enrollment_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not {'is_active', 'group', 'group_id'} & set(update_fields)):
+        return
+    previous = None
+    if instance.pk is not None:
+        previous = Enrollment.all_branches.filter(pk=instance.pk).values_list('is_active', 'group_id').first()
+    instance._place_before = previous
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, **kwargs):
+    if '_place_before' in instance.__dict__:
+        sync_saved(instance, instance.__dict__.pop('_place_before'))
+
+
+def outbox_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # raw - загрузка фикстур, она не является изменением данных школы
+    if raw or outbox.is_ignored(sender, update_fields):
+        return
+    outbox.record([instance], 'insert' if created else 'update')
+
+
+def outbox_deleted(sender, instance, **kwargs):
+    outbox.record([instance], 'delete')
+
+
+for model in OUTBOX_MODELS:
+    post_save.connect(outbox_saved, sender=model, dispatch_uid=f'outbox_saved_{model.__name__}')
+    post_delete.connect(outbox_deleted, sender=model, dispatch_uid=f'outbox_deleted_{model.__name__}')
+
+
+@receiver(pre_delete, sender=Teacher)
+def teacher_deleting(sender, instance, **kwargs):
+    # Группы отвязываются (SET_NULL) без сигналов, запоминаем их заранее
+    instance._outbox_group_ids = list(instance.groups.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Teacher)
+def teacher_deleted(sender, instance, **kwargs):
+    group_ids = getattr(instance, '_outbox_group_ids', None)
+    if group_ids:
+        outbox.record(Group._base_manager.filter(pk__in=group_ids), 'update')
+
+
+@receiver(m2m_changed, sender=Teacher.directions.through)
+def teacher_directions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # После очистки уже не узнать, какие связи были удалены
+        related = instance.teachers if reverse else instance.directions
+        instance._outbox_cleared = list(related.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_outbox_cleared', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+    pairs = [(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set or ()]
+    outbox.record_pairs(sender, pairs, 'delete' if action != 'post_add' else 'insert')
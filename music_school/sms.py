@@ -0,0 +1,67 @@
+"""SMS-шлюзы для уведомлений родителей.
+
+Шлюз выбирается настройкой SMS_GATEWAY (путь к классу). Реальный шлюз
+наследует BaseSMSGateway и реализует send_batch; FakeSMSGateway ничего
+не отправляет и нужен для разработки и тестов - по умолчанию он
+включается только при DEBUG.
+"""
+import itertools
+from collections import deque
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+@dataclass
+class SendResult:
+    ok: bool
+    message_id: str = ''
+    error: str = ''
+
+
+class BaseSMSGateway:
+    def send_batch(self, messages):
+        """Отправляет пачку [(телефон, текст), ...].
+
+        Возвращает список SendResult в том же порядке. Исключение означает,
+        что не отправлено ни одно сообщение пачки.
+        """
+        raise NotImplementedError
+
+
+class FakeSMSGateway(BaseSMSGateway):
+    """Шлюз-заглушка: складывает последние сообщения в общую очередь sent.
+
+    Номера из failing_phones возвращают ошибку доставки, а при down=True
+    шлюз недоступен целиком.
+    """
+    sent = deque(maxlen=1000)
+    failing_phones = set()
+    down = False
+    _ids = itertools.count(1)
+
+    def send_batch(self, messages):
+        if self.down:
+            raise ConnectionError('SMS-шлюз недоступен')
+        results = []
+        for phone, text in messages:
+            if phone in self.failing_phones:
+                results.append(SendResult(ok=False, error='Номер недоступен'))
+                continue
+            self.sent.append((phone, text))
+            results.append(SendResult(ok=True, message_id=f'fake-{next(self._ids)}'))
+        return results
+
+    @classmethod
+    def reset(cls):
+        cls.sent.clear()
+        cls.failing_phones.clear()
+        cls.down = False
+
+
+def get_gateway():
+    if not settings.SMS_GATEWAY:
+        raise ImproperlyConfigured('Не задан SMS_GATEWAY: уведомления некуда отправлять')
+    return import_string(settings.SMS_GATEWAY)()
@@ -1,3 +1,768 @@
-from django.test import TestCase
+import gzip
+import json
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import Permission, User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, connections
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import enrollment as enrollment_service, outbox
+from .archive import archive, restore_student
+from .branches import SESSION_KEY, use_branch
+from .attendance import mark_attendance
+from .billing import BillingInProgress, generate_invoices, prorated_fee
+from .dumps import Anonymizer, dump, dump_path, restore, restore_model, school_models
+from .enrollment import deactivate, enroll
+from .notifications import RateLimiter, dispatch, enqueue, notify
+from .models import (
+    ArchivedStudent, Attendance, BillingRun, Branch, Direction, Enrollment, Group, Invoice, Notification,
+    NotificationDelivery, OutboxConsumer, OutboxEvent, Student, Teacher, WaitlistEntry,
+)
+from .sms import FakeSMSGateway, get_gateway
+from .utils import normalize_phone
+from .workload import annotate_workload, compute_workload, parse_schedule_minutes
+
+PRESENT, LATE, ABSENT = Attendance.Status.PRESENT, Attendance.Status.LATE, Attendance.Status.ABSENT
+
+
+def make_group(name='Группа', capacity=None, fee=Decimal('1000.00'), schedule='Пн 10:00-11:00',
+               direction='Фортепиано', teacher=None):
+    direction, _ = Direction.objects.get_or_create(
+        name=direction, defaults={'years_of_study': 7, 'monthly_fee': fee},
+    )
+    return Group.objects.create(
+        direction=direction, year_of_study=1, name=name, schedule=schedule, capacity=capacity, teacher=teacher,
+    )
+
+
+def make_students(count, phone='+7 900 000-00-00', prefix='Студент'):
+    return [
+        Student.objects.create(
+            first_name=str(i), last_name=prefix, birth_date=date(2015, 1, 1), phone_parent=phone,
+        )
+        for i in range(count)
+    ]
+
+
+class MarkAttendanceTests(TestCase):
+    def setUp(self):
+        self.group = make_group()
+        self.students = make_students(3)
+        self.enrollments = [Enrollment.objects.create(student=s, group=self.group) for s in self.students]
+
+    def counters(self):
+        return [
+            (e.lessons_marked, e.lessons_attended)
+            for e in Enrollment.objects.filter(group=self.group).order_by('student_id')
+        ]
+
+    def test_first_marking_counts_every_student(self):
+        a, b, c = self.students
+        lesson = mark_attendance(self.group, date(2025, 9, 1), {a.pk: PRESENT, b.pk: LATE, c.pk: ABSENT})
+        self.assertEqual((lesson.marked_count, lesson.attended_count), (3, 2))
+        self.assertEqual(self.counters(), [(1, 1), (1, 1), (1, 0)])
+
+    def test_remarking_applies_only_the_difference(self):
+        a, b, c = self.students
+        day = date(2025, 9, 1)
+        mark_attendance(self.group, day, {a.pk: PRESENT, b.pk: ABSENT})
+        lesson = mark_attendance(self.group, day, {a.pk: ABSENT, b.pk: LATE, c.pk: PRESENT})
+        self.assertEqual((lesson.marked_count, lesson.attended_count), (3, 2))
+        self.assertEqual(self.counters(), [(1, 0), (1, 1), (1, 1)])
+        self.assertEqual(Attendance.objects.filter(lesson=lesson).count(), 3)
+
+    def test_unchanged_marks_leave_counters_alone(self):
+        a = self.students[0]
+        day = date(2025, 9, 1)
+        mark_attendance(self.group, day, {a.pk: PRESENT})
+        lesson = mark_attendance(self.group, day, {a.pk: PRESENT})
+        self.assertEqual((lesson.marked_count, lesson.attended_count), (1, 1))
+        self.assertEqual(self.counters()[0], (1, 1))
+
+    def test_inactive_enrollment_is_rejected(self):
+        a, b, _ = self.students
+        Enrollment.objects.filter(pk=self.enrollments[1].pk).update(is_active=False)
+        with self.assertRaises(ValueError):
+            mark_attendance(self.group, date(2025, 9, 1), {a.pk: PRESENT, b.pk: PRESENT})
+        self.assertFalse(Attendance.objects.exists())
+        self.assertEqual(self.counters(), [(0, 0), (0, 0), (0, 0)])
+
+
+class ProratedFeeTests(TestCase):
+    def test_full_month_when_joined_before_period(self):
+        self.assertEqual(prorated_fee(Decimal('3000.00'), date(2025, 8, 20), date(2025, 9, 1)), Decimal('3000.00'))
+        self.assertEqual(prorated_fee(Decimal('3000.00'), date(2025, 9, 1), date(2025, 9, 1)), Decimal('3000.00'))
+
+    def test_part_of_month_is_rounded_to_cents(self):
+        # 20 из 30 дней сентября
+        self.assertEqual(prorated_fee(Decimal('3000.00'), date(2025, 9, 11), date(2025, 9, 1)), Decimal('2000.00'))
+        # 1 из 31 дня октября
+        self.assertEqual(prorated_fee(Decimal('1000.00'), date(2025, 10, 31), date(2025, 10, 1)), Decimal('32.26'))
+
+
+# Счета формируются пулом потоков, им нужны зафиксированные данные
+class GenerateInvoicesTests(TransactionTestCase):
+    period = date(2025, 9, 1)
+
+    def setUp(self):
+        self.group = make_group(fee=Decimal('3000.00'))
+
+    def enroll(self, student, joined=date(2025, 8, 1)):
+        enrollment = Enrollment.objects.create(student=student, group=self.group)
+        Enrollment.objects.filter(pk=enrollment.pk).update(date_joined=joined)
+        return enrollment
+
+    def test_siblings_after_the_first_get_discount(self):
+        first, second = make_students(2, phone='+7 (900) 111-22-33')
+        other, = make_students(1, phone='89001112234')
+        for student in (first, second, other):
+            self.enroll(student)
+        run = generate_invoices(self.period, workers=2, chunk_size=1)
+        self.assertEqual(run.status, BillingRun.Status.DONE)
+        self.assertEqual((run.enrollments_processed, run.invoices_created), (3, 3))
+        amounts = dict(Invoice.objects.values_list('enrollment__student_id', 'amount'))
+        self.assertEqual(amounts, {
+            first.pk: Decimal('3000.00'), second.pk: Decimal('2700.00'), other.pk: Decimal('3000.00'),
+        })
+        self.assertEqual(set(Invoice.objects.values_list('phone_parent', flat=True)), {'79001112233', '79001112234'})
+
+    def test_joined_mid_month_is_prorated(self):
+        student, = make_students(1)
+        self.enroll(student, joined=date(2025, 9, 16))
+        generate_invoices(self.period, workers=1)
+        self.assertEqual(Invoice.objects.get().amount, Decimal('1500.00'))
+
+    def test_later_enrollments_are_not_billed(self):
+        student, = make_students(1)
+        self.enroll(student, joined=date(2025, 10, 1))
+        run = generate_invoices(self.period, workers=1)
+        self.assertEqual((run.enrollments_processed, run.invoices_created), (0, 0))
+
+    def test_rerun_of_finished_period_bills_only_missing(self):
+        first, second = make_students(2, phone='')
+        self.enroll(first)
+        generate_invoices(self.period, workers=1)
+        self.enroll(second, joined=date(2025, 9, 20))
+        run = generate_invoices(self.period, workers=2, chunk_size=1)
+        self.assertEqual(run.status, BillingRun.Status.DONE)
+        self.assertEqual((run.enrollments_processed, run.invoices_created), (2, 2))
+        self.assertEqual(Invoice.objects.count(), 2)
+        run = generate_invoices(self.period, workers=1)
+        self.assertEqual(run.invoices_created, 2)
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_interrupted_run_resumes_after_cursor(self):
+        students = make_students(3, phone='')
+        enrollments = [self.enroll(s) for s in students]
+        BillingRun.objects.create(
+            period=self.period, status=BillingRun.Status.FAILED,
+            last_enrollment_id=enrollments[0].pk, enrollments_processed=1, invoices_created=0,
+        )
+        run = generate_invoices(self.period, workers=1)
+        self.assertEqual((run.enrollments_processed, run.invoices_created), (3, 2))
+        # Пустой телефон не объединяет студентов в семью
+        self.assertFalse(Invoice.objects.filter(discount__gt=0).exists())
+        self.assertFalse(Invoice.objects.filter(enrollment=enrollments[0]).exists())
+
+    def test_concurrent_run_of_same_period_is_rejected(self):
+        student, = make_students(1)
+        self.enroll(student)
+        BillingRun.objects.create(period=self.period, heartbeat_at=timezone.now())
+        with self.assertRaises(BillingInProgress):
+            generate_invoices(self.period, workers=1)
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_abandoned_run_is_taken_over(self):
+        student, = make_students(1)
+        self.enroll(student)
+        BillingRun.objects.create(period=self.period, heartbeat_at=timezone.now() - timedelta(hours=1))
+        run = generate_invoices(self.period, workers=1)
+        self.assertEqual((run.status, run.invoices_created), (BillingRun.Status.DONE, 1))
+
+
+def in_threads(func, items, workers=8):
+    """Вызывает func для каждого элемента из пула потоков, каждый со своим соединением"""
+    def call(item):
+        try:
+            return func(item)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(call, items))
+
+
+class EnrollmentCounterTests(TestCase):
+    def setUp(self):
+        self.group = make_group(capacity=2)
+        self.students = make_students(3)
+
+    def active_count(self):
+        self.group.refresh_from_db()
+        return self.group.active_count
+
+    def test_direct_writes_keep_counter(self):
+        a, b, _ = self.students
+        enrollment = Enrollment.objects.create(student=a, group=self.group)
+        Enrollment.objects.get_or_create(student=b, group=self.group, defaults={'is_active': True})
+        self.assertEqual(self.active_count(), 2)
+        enrollment.is_active = False
+        enrollment.save()
+        self.assertEqual(self.active_count(), 1)
+        enrollment.is_active = True
+        enrollment.save(update_fields=['is_active'])
+        self.assertEqual(self.active_count(), 2)
+        enrollment.delete()
+        self.assertEqual(self.active_count(), 1)
+
+    def test_saving_other_fields_does_not_count(self):
+        enrollment = Enrollment.objects.create(student=self.students[0], group=self.group)
+        enrollment.save()
+        enrollment.save(update_fields=['lessons_marked'])
+        self.assertEqual(self.active_count(), 1)
+
+    def test_enroll_uses_waitlist_when_full(self):
+        a, b, c = self.students
+        self.assertIsInstance(enroll(a, self.group), Enrollment)
+        self.assertIsInstance(enroll(b, self.group), Enrollment)
+        self.assertIsInstance(enroll(c, self.group), WaitlistEntry)
+        # Повторный запрос зачисленного студента место не занимает
+        self.assertIsInstance(enroll(a, self.group), Enrollment)
+        self.assertEqual(self.active_count(), 2)
+        self.assertFalse(Enrollment.objects.filter(student=c).exists())
+
+    def test_admin_add_to_full_group_leaves_only_waitlist(self):
+        a, b, c = self.students
+        enroll(a, self.group)
+        enroll(b, self.group)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        response = self.client.post('/admin/music_school/enrollment/add/', {
+            'student': c.pk, 'group': self.group.pk, 'is_active': 'on',
+        })
+        self.assertRedirects(response, '/admin/music_school/waitlistentry/')
+        self.assertFalse(Enrollment.objects.filter(student=c).exists())
+        self.assertTrue(WaitlistEntry.objects.filter(student=c, group=self.group).exists())
+
+    def test_admin_add_with_free_place_enrolls(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        response = self.client.post('/admin/music_school/enrollment/add/', {
+            'student': self.students[0].pk, 'group': self.group.pk, 'is_active': 'on',
+        })
+        enrollment = Enrollment.objects.get()
+        self.assertRedirects(response, '/admin/music_school/enrollment/')
+        self.assertTrue(enrollment.is_active)
+        self.assertEqual(self.active_count(), 1)
+
+    def test_raising_capacity_in_admin_promotes_waitlist(self):
+        for student in self.students:
+            enroll(student, self.group)
+        request = RequestFactory().post('/')
+        request.user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        self.group.capacity = 3
+        admin.site._registry[Group].save_model(request, self.group, SimpleNamespace(changed_data=['capacity']), True)
+        self.assertEqual(self.active_count(), 3)
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+
+# Потоки работают с зафиксированными данными, поэтому TransactionTestCase
+class EnrollmentConcurrencyTests(TransactionTestCase):
+    capacity = 10
+
+    def setUp(self):
+        self.group = make_group(capacity=self.capacity)
+
+    def assertConsistent(self, requested):
+        self.group.refresh_from_db()
+        active = Enrollment.objects.filter(group=self.group, is_active=True).count()
+        left = Enrollment.objects.filter(group=self.group, is_active=False).count()
+        waiting = WaitlistEntry.objects.filter(group=self.group).count()
+        self.assertLessEqual(active, self.capacity)
+        self.assertEqual(self.group.active_count, active)
+        self.assertEqual(active + left + waiting, requested)
+        return active, waiting
+
+    def test_parallel_enrollment_does_not_overbook(self):
+        students = make_students(40)
+        random.shuffle(students)
+        results = in_threads(lambda student: enroll(student, self.group), students)
+        self.assertEqual(sum(isinstance(r, Enrollment) for r in results), self.capacity)
+        self.assertEqual(self.assertConsistent(len(students)), (self.capacity, 30))
+
+    def test_same_student_twice_takes_one_place(self):
+        student, = make_students(1)
+        in_threads(lambda _: enroll(student, self.group), range(8))
+        self.assertEqual(self.assertConsistent(1), (1, 0))
+
+    def test_parallel_drops_promote_waitlist_in_order(self):
+        students = make_students(15)
+        for student in students:
+            enroll(student, self.group)
+        dropped = random.sample(list(Enrollment.objects.filter(group=self.group, is_active=True)), 4)
+        promoted = [e for batch in in_threads(deactivate, dropped) for e in batch]
+        self.assertEqual(len(promoted), 4)
+        self.assertEqual(sorted(e.student_id for e in promoted), [s.pk for s in students[10:14]])
+        self.assertEqual(self.assertConsistent(len(students)), (self.capacity, 1))
+
+    def test_stress_command_reports_throughput(self):
+        out = StringIO()
+        call_command('stress_enrollment', students=40, capacity=self.capacity, threads=8, drop=3, stdout=out)
+        self.assertIn('в секунду', out.getvalue())
+        self.assertEqual(out.getvalue().count('OK'), 2)
+        self.assertFalse(Student.objects.filter(last_name='stress-enrollment').exists())
+
+
+class DumpRestoreTests(TransactionTestCase):
+    def setUp(self):
+        self.group = make_group(capacity=5)
+        for student in make_students(3):
+            enroll(student, self.group)
+        mark_attendance(self.group, date(2025, 9, 1), {
+            s.pk: PRESENT for s in Student.objects.all()
+        })
+
+    def snapshot(self):
+        return {
+            model: list(model._base_manager.order_by('pk').values())
+            for level in school_models() for model in level
+        }
+
+    def test_round_trip(self):
+        before = self.snapshot()
+        with tempfile.TemporaryDirectory() as directory:
+            dump(directory)
+            restore(directory, flush=True)
+        self.assertEqual(self.snapshot(), before)
+
+    def test_child_tables_load_before_parents(self):
+        before = self.snapshot()
+        models = [model for level in school_models() for model in level]
+        with tempfile.TemporaryDirectory() as directory:
+            dump(directory)
+            connection.ops.execute_sql_flush(
+                connection.ops.sql_flush(no_style(), [model._meta.db_table for model in models])
+            )
+            # Внешние ключи проверяются после загрузки, а не при вставке
+            for model in reversed(models):
+                restore_model(model, directory)
+        connection.check_constraints(table_names=[model._meta.db_table for model in models])
+        self.assertEqual(self.snapshot(), before)
+
+    def test_missing_dump_does_not_flush(self):
+        before = self.snapshot()
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(FileNotFoundError):
+                restore(directory, flush=True)
+        self.assertEqual(self.snapshot(), before)
+
+    def test_failed_restore_keeps_flushed_data(self):
+        before = self.snapshot()
+        with tempfile.TemporaryDirectory() as directory:
+            dump(directory)
+            path = dump_path(directory, Enrollment)
+            with gzip.open(path, 'rt', encoding='utf-8') as fh:
+                rows = [json.loads(line) for line in fh]
+            rows[0]['group_id'] = 10 ** 6
+            with gzip.open(path, 'wt', encoding='utf-8') as fh:
+                fh.writelines(json.dumps(row) + '\n' for row in rows)
+            with self.assertRaises(IntegrityError):
+                restore(directory, flush=True)
+        self.assertEqual(self.snapshot(), before)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.old_group = make_group('Старая')
+        self.group = make_group('Новая', capacity=1)
+        self.student, = make_students(1)
+        Enrollment.objects.create(student=self.student, group=self.old_group)
+        Enrollment.objects.filter(student=self.student).update(
+            is_active=False, date_joined=date(2020, 9, 1), date_left=date(2021, 5, 31),
+        )
+
+    def test_graduate_is_archived_with_history(self):
+        self.assertEqual(archive(days=365), (1, 0))
+        archived = ArchivedStudent.objects.get()
+        self.assertEqual(archived.original_id, self.student.pk)
+        self.assertFalse(Student.objects.exists())
+
+    def test_restored_into_group_is_not_archived_again(self):
+        archive(days=365)
+        restore_student(ArchivedStudent.objects.get(), self.group)
+        # История вернулась неактивным зачислением
+        self.assertTrue(Enrollment.objects.filter(student_id=self.student.pk, group=self.old_group, is_active=False).exists())
+        # Студент остаётся, в архив уходит только старое зачисление
+        self.assertEqual(archive(days=365), (0, 1))
+        self.assertTrue(Enrollment.objects.filter(student_id=self.student.pk, group=self.group, is_active=True).exists())
+
+    def test_waitlisted_student_is_not_archived(self):
+        enroll(make_students(1, prefix='Другой')[0], self.group)
+        enroll(self.student, self.group)
+        self.assertTrue(WaitlistEntry.objects.filter(student=self.student).exists())
+        self.assertEqual(archive(days=365), (0, 1))
+        self.assertTrue(WaitlistEntry.objects.filter(student=self.student).exists())
+
+    def test_admin_restore_asks_for_group(self):
+        archive(days=365)
+        archived = ArchivedStudent.objects.get()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        url = '/admin/music_school/archivedstudent/'
+        data = {'action': 'restore', '_selected_action': [archived.pk]}
+        response = self.client.post(url, data)
+        self.assertTemplateUsed(response, 'admin/music_school/archivedstudent/restore.html')
+        self.assertTrue(ArchivedStudent.objects.exists())
+        response = self.client.post(url, {**data, 'apply': '1', 'group': self.group.pk})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ArchivedStudent.objects.exists())
+        self.assertTrue(Enrollment.objects.filter(student_id=self.student.pk, group=self.group, is_active=True).exists())
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        OutboxEvent.objects.all().delete()
+
+    def test_saves_and_bulk_writes_are_recorded(self):
+        student, = make_students(1)
+        Student.objects.filter(pk=student.pk).update(first_name='Новое')
+        student.delete()
+        events = outbox.fetch()
+        self.assertEqual(
+            [(e.model, e.operation) for e in events],
+            [('music_school.student', 'insert'), ('music_school.student', 'update'), ('music_school.student', 'delete')],
+        )
+        self.assertEqual([e.position for e in events], sorted(e.position for e in events))
+        self.assertEqual(events[1].payload['first_name'], 'Новое')
+
+    def test_service_counters_are_not_recorded(self):
+        group = make_group()
+        OutboxEvent.objects.all().delete()
+        Group.objects.filter(pk=group.pk).update(active_count=5)
+        self.assertEqual(outbox.fetch(), [])
+
+    def test_cursor_skips_nothing_committed_late(self):
+        make_students(3)
+        first, second, third = OutboxEvent.objects.order_by('pk')
+        # Событие с меньшим id, зафиксированное после чтения ленты
+        late = dict(pk=first.pk, model=first.model, object_id=first.object_id, operation=first.operation,
+                    payload=first.payload)
+        first.delete()
+        events = outbox.fetch()
+        self.assertEqual([e.pk for e in events], [second.pk, third.pk])
+        cursor = events[-1].position
+        OutboxEvent.objects.create(**late)
+        events = outbox.fetch(after=cursor)
+        self.assertEqual([e.pk for e in events], [late['pk']])
+        self.assertGreater(events[0].position, cursor)
+        self.assertEqual(outbox.fetch(after=events[0].position), [])
+
+    def test_limit_pages_through_feed(self):
+        make_students(5)
+        page = outbox.fetch(limit=2)
+        rest = outbox.fetch(after=page[-1].position, limit=10)
+        self.assertEqual(len(page) + len(rest), 5)
+        self.assertLess(page[-1].position, rest[0].position)
+
+    def test_acknowledge_moves_only_forward(self):
+        self.assertEqual(outbox.acknowledge('accounting', 10).position, 10)
+        self.assertEqual(outbox.acknowledge('accounting', 3).position, 10)
+
+    def login(self, *codenames):
+        user = User.objects.create_user('-'.join(codenames), password='x')
+        user.user_permissions.set(Permission.objects.filter(content_type__app_label='music_school', codename__in=codenames))
+        self.client.force_login(user)
+
+    def test_feed_rejects_non_positive_limit(self):
+        self.login('view_outboxevent')
+        self.assertEqual(self.client.get('/api/changes/', {'limit': -1}).status_code, 400)
+        self.assertEqual(self.client.get('/api/changes/', {'limit': 1}).status_code, 200)
+        with self.assertRaises(CommandError):
+            call_command('outbox_feed', limit=0)
+
+    def test_ack_requires_change_permission(self):
+        body = json.dumps({'consumer': 'accounting', 'position': 5})
+        self.login('view_outboxevent')
+        self.assertEqual(self.client.post('/api/changes/ack/', body, content_type='application/json').status_code, 403)
+        self.login('view_outboxevent', 'change_outboxconsumer')
+        self.assertEqual(self.client.post('/api/changes/ack/', body, content_type='application/json').status_code, 200)
+        self.assertEqual(OutboxConsumer.objects.get().position, 5)
+
+    def test_compact_keeps_events_unread_by_someone(self):
+        make_students(4)
+        events = outbox.fetch()
+        outbox.acknowledge('accounting', events[-1].position)
+        outbox.acknowledge('crm', events[1].position)
+        self.assertEqual(outbox.compact(), 2)
+        self.assertEqual([e.pk for e in outbox.fetch()], [e.pk for e in events[2:]])
+        OutboxConsumer.objects.filter(name='crm').update(position=events[-1].position)
+        self.assertEqual(outbox.compact(), 2)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_anonymized_dump_scrubs_payloads(self):
+        make_students(1, phone='8 (916) 123-45-67', prefix='Соколов')
+        event = OutboxEvent.objects.get()
+        row = {'id': event.pk, 'model': event.model, 'object_id': event.object_id, 'payload': event.payload}
+        payload = Anonymizer()(OutboxEvent, row)['payload']
+        self.assertNotIn('Соколов', str(payload))
+        self.assertNotIn('79161234567', normalize_phone(payload['phone_parent']))
+        # Исходное событие не меняется
+        self.assertEqual(event.payload['last_name'], 'Соколов')
+
+
+class BranchScopeTests(TestCase):
+    def setUp(self):
+        self.other = Branch.objects.create(name='Северный', code='north')
+        self.group = make_group()
+        with use_branch(self.other):
+            self.other_group = make_group('Северная', capacity=0)
+        student, = make_students(1)
+        enroll(student, self.other_group)
+
+    def test_manager_is_scoped_to_current_branch(self):
+        with use_branch(self.other):
+            self.assertEqual(list(Group.objects.all()), [self.other_group])
+            self.assertEqual(self.other_group.direction.branch, self.other)
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(Group.all_branches.count(), 2)
+
+    def test_admin_scopes_models_without_branch_field(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        url = '/admin/music_school/waitlistentry/'
+        self.assertContains(self.client.get(url), 'Северная')
+        session = self.client.session
+        session[SESSION_KEY] = self.group.branch_id
+        session.save()
+        self.assertNotContains(self.client.get(url), 'Северная')
+
+
+# Филиал с отдельной базой: данные пишутся в branch2, справочник филиалов - в обе базы
+class BranchDatabaseTests(TransactionTestCase):
+    databases = {'default', 'branch2'}
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='Филиал 2', code='b2', database='branch2')
+        Branch.objects.using('branch2').create(pk=self.branch.pk, name=self.branch.name, code='b2', database='branch2')
+
+    def test_branch_data_goes_to_its_database(self):
+        with use_branch(self.branch):
+            group = make_group(capacity=1)
+            first, second = make_students(2)
+            self.assertIsInstance(enroll(first, group), Enrollment)
+            self.assertIsInstance(enroll(second, group), WaitlistEntry)
+            mark_attendance(group, date(2025, 9, 1), {first.pk: PRESENT})
+            self.assertEqual(Group.objects.get().active_count, 1)
+        for model in (Direction, Group, Student, Enrollment, WaitlistEntry, Attendance):
+            self.assertTrue(model._base_manager.using('branch2').exists(), model)
+            self.assertFalse(model._base_manager.using('default').exists(), model)
+        # Вне филиала запросы идут в основную базу
+        self.assertFalse(Group.objects.exists())
+
+    def test_services_open_transaction_on_branch_database(self):
+        seen = []
+        take_place = enrollment_service._take_place
+
+        def spy(group_id):
+            seen.append((connections['branch2'].in_atomic_block, connections['default'].in_atomic_block))
+            return take_place(group_id)
+
+        with use_branch(self.branch), mock.patch.object(enrollment_service, '_take_place', spy):
+            student, = make_students(1)
+            enroll(student, make_group())
+        self.assertEqual(seen, [(True, False)])
+
+    def test_billing_covers_branch_database(self):
+        group = make_group()
+        enroll(make_students(1, phone='+7 900 111-11-11')[0], group)
+        with use_branch(self.branch):
+            group = make_group()
+            # Брат в основной базе, сестра - в базе филиала
+            enroll(make_students(1, phone='89001111111')[0], group)
+        run = generate_invoices(timezone.localdate(), workers=2)
+        self.assertEqual((run.enrollments_processed, run.invoices_created), (2, 2))
+        self.assertEqual(Invoice.all_branches.using('default').get().discount, 0)
+        self.assertGreater(Invoice.all_branches.using('branch2').get().discount, 0)
+
+    @override_settings(SMS_RATE_PER_SECOND=1000)
+    def test_dispatch_and_workload_cover_branch_database(self):
+        FakeSMSGateway.reset()
+        self.addCleanup(FakeSMSGateway.reset)
+        with use_branch(self.branch):
+            teacher = Teacher.objects.create(first_name='Имя', last_name='Преподаватель')
+            group = make_group(teacher=teacher)
+            enroll(make_students(1)[0], group)
+            notify('Занятие переносится', group=group)
+        self.assertEqual(dispatch(FakeSMSGateway()), (1, 0))
+        workloads, _ = compute_workload()
+        self.assertEqual([(w.key, w.minutes) for w in workloads], [(('branch2', teacher.pk), 60)])
+
+
+@override_settings(SMS_RETRY_BASE_SECONDS=0, SMS_MAX_ATTEMPTS=3, SMS_RATE_PER_SECOND=1000)
+class NotificationTests(TestCase):
+    def setUp(self):
+        FakeSMSGateway.reset()
+        self.addCleanup(FakeSMSGateway.reset)
+        self.gateway = FakeSMSGateway()
+        self.group = make_group()
+        # Брат и сестра с одним телефоном в разной записи и ещё одна семья
+        students = make_students(2, phone='+7 (916) 111-22-33') + make_students(1, phone='89162223344')
+        students[1].phone_parent = '8 916 111 22 33'
+        students[1].save()
+        for student in students:
+            enroll(student, self.group)
+
+    def test_siblings_get_one_message(self):
+        notification = notify('Занятие отменено', Notification.Kind.CANCELLATION, group=self.group)
+        self.assertEqual(
+            sorted(notification.deliveries.values_list('phone', flat=True)), ['79161112233', '79162223344'],
+        )
+        self.assertEqual(enqueue(notification), 0)
+        self.assertEqual(dispatch(self.gateway), (2, 0))
+        self.assertEqual(sorted(phone for phone, _ in FakeSMSGateway.sent), ['79161112233', '79162223344'])
+        self.assertEqual(dispatch(self.gateway), (0, 0))
+
+    def test_failed_delivery_is_retried_then_given_up(self):
+        FakeSMSGateway.failing_phones.add('79162223344')
+        notification = notify('Объявление', group=self.group)
+        self.assertEqual(dispatch(self.gateway), (1, 3))
+        delivery = notification.deliveries.get(phone='79162223344')
+        self.assertEqual((delivery.status, delivery.attempts), (NotificationDelivery.Status.FAILED, 3))
+        self.assertEqual(delivery.last_error, 'Номер недоступен')
+
+    @override_settings(SMS_RETRY_BASE_SECONDS=60)
+    def test_gateway_outage_keeps_deliveries_queued(self):
+        FakeSMSGateway.down = True
+        notification = notify('Объявление', group=self.group)
+        self.assertEqual(dispatch(self.gateway), (0, 2))
+        # Повтор только после паузы
+        self.assertEqual(dispatch(self.gateway), (0, 0))
+        self.assertEqual(
+            set(notification.deliveries.values_list('status', 'attempts')), {(NotificationDelivery.Status.PENDING, 1)},
+        )
+
+    @override_settings(SMS_RATE_PER_SECOND=100, SMS_BATCH_SIZE=150)
+    def test_batch_larger_than_rate_is_sent(self):
+        students = make_students(148, phone='')
+        for i, student in enumerate(students):
+            student.phone_parent = f'+7900{i:07d}'
+            student.save()
+            enroll(student, self.group)
+        notify('Объявление', group=self.group)
+        started = time.monotonic()
+        self.assertEqual(dispatch(self.gateway), (150, 0))
+        # 150 сообщений при 100 в секунду и полном ведре - около половины секунды
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_rate_limiter_splits_large_requests(self):
+        limiter = RateLimiter(rate=50)
+        started = time.monotonic()
+        limiter.acquire(75)
+        self.assertGreaterEqual(time.monotonic() - started, 0.4)
+
+    @override_settings(SMS_GATEWAY='')
+    def test_missing_gateway_fails_loudly(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_gateway()
+
+
+class ScheduleParsingTests(TestCase):
+    def test_formats(self):
+        cases = {
+            'Пн, Ср 16:00-17:30': 180,
+            'Пн 16:00-17:00, Ср 15:00-16:30': 150,
+            'Пн 16:00-17:00; Чт 15:00-16:30': 150,
+            'Пн-Пт 10:00-11:00': 300,
+            'Сб-Пн 10:00-11:00': 180,
+            'Понедельник 10:00-11:00': 60,
+            'среда, пятница 18.00 – 19.30': 180,
+            'Вт 10:00-11:00, 12:00-13:00': 120,
+        }
+        for schedule, minutes in cases.items():
+            with self.subTest(schedule):
+                self.assertEqual(parse_schedule_minutes(schedule), minutes)
+
+    def test_unrecognized_parts_are_ignored(self):
+        for schedule in ('', None, 'по договорённости', '16:00-17:00', 'Пн 17:00-16:00', 'Пнд 10:00-11:00'):
+            with self.subTest(schedule):
+                self.assertEqual(parse_schedule_minutes(schedule), 0)
+
+    def test_group_stores_minutes(self):
+        group = make_group(schedule='Пн-Ср 10:00-11:00')
+        self.assertEqual(group.weekly_minutes, 180)
+        group.schedule = 'Чт 10:00-10:45'
+        group.save(update_fields=['schedule'])
+        group.refresh_from_db()
+        self.assertEqual(group.weekly_minutes, 45)
+
+
+class WorkloadTests(TestCase):
+    def setUp(self):
+        self.busy = Teacher.objects.create(first_name='Анна', last_name='Иванова')
+        self.idle = Teacher.objects.create(first_name='Пётр', last_name='Петров')
+        self.free = Teacher.objects.create(first_name='Ольга', last_name='Сидорова')
+        piano = make_group('Ф-1', teacher=self.busy, schedule='Пн, Ср 10:00-11:30')
+        make_group('Ф-2', teacher=self.busy, schedule='Пт 10:00-11:00')
+        make_group('Г-1', direction='Гитара', teacher=self.busy, schedule='Вт 10:00-12:00')
+        make_group('Г-2', direction='Гитара', teacher=self.idle, schedule='Чт 10:00-10:45')
+        for student in make_students(3):
+            enroll(student, piano)
+        Enrollment.objects.filter(student__first_name='2').update(is_active=False)
+
+    def test_annotation(self):
+        rows = {
+            t.pk: (t.workload_groups, t.workload_minutes, t.workload_contacts)
+            for t in annotate_workload(Teacher.objects.all())
+        }
+        self.assertEqual(rows, {self.busy.pk: (3, 360, 2), self.idle.pk: (1, 45, 0), self.free.pk: (0, 0, 0)})
+
+    def test_direction_totals(self):
+        workloads, directions = compute_workload()
+        by_teacher = {w.teacher_id: (w.minutes, w.groups, w.contacts) for w in workloads}
+        self.assertEqual(by_teacher[self.busy.pk], (360, 3, 2))
+        self.assertEqual(by_teacher[self.free.pk], (0, 0, 0))
+        totals = {d['name']: (d['minutes'], d['teachers']) for d in directions.values()}
+        self.assertEqual(totals, {
+            'Фортепиано': (240, {('default', self.busy.pk): 240}),
+            'Гитара': (165, {('default', self.busy.pk): 120, ('default', self.idle.pk): 45}),
+        })
+
+    def test_admin_sorts_by_weekly_hours(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        url = '/admin/music_school/teacher/'
+        # weekly_hours - шестая колонка list_display
+        response = self.client.get(url, {'o': '-6'})
+        self.assertEqual([t.pk for t in response.context['cl'].result_list], [self.busy.pk, self.idle.pk, self.free.pk])
+        response = self.client.get(url, {'o': '6'})
+        self.assertEqual([t.pk for t in response.context['cl'].result_list], [self.free.pk, self.idle.pk, self.busy.pk])
+
+    def test_admin_changelist_queries_do_not_grow_with_rows(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        url = '/admin/music_school/teacher/'
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        for i in range(5):
+            teacher = Teacher.objects.create(first_name='Т', last_name=f'Новый-{i}')
+            teacher.directions.set(Direction.objects.all())
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(url)
+        self.assertEqual(len(after), len(before))
+
+    def test_report_view(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        response = self.client.get('/admin/music_school/teacher/workload/')
+        self.assertContains(response, 'Иванова Анна')
+        self.assertEqual([w.teacher_id for w in response.context['workloads']], [self.busy.pk, self.idle.pk, self.free.pk])
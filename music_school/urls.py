@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'music_school'
+
+urlpatterns = [
+    path('groups/<int:group_id>/attendance/', views.group_attendance, name='group_attendance'),
+    path('changes/', views.changes, name='changes'),
+    path('changes/ack/', views.changes_ack, name='changes_ack'),
+]
@@ -0,0 +1,28 @@
+import re
+
+from django.db import connections
+
+
+def normalize_phone(phone):
+    """Приводит телефон к виду 7XXXXXXXXXX, чтобы сравнивать номера родителей"""
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    elif len(digits) == 10:
+        digits = '7' + digits
+    return digits
+
+
+def bulk_insert_raw(model, objs, using='default'):
+    """Вставляет объекты пачками как есть, с заданными pk.
+
+    В отличие от bulk_create не вызывает pre_save, поэтому поля с
+    auto_now_add сохраняют исходные даты (как при loaddata).
+    """
+    if not objs:
+        return
+    fields = model._meta.local_concrete_fields
+    manager = model._base_manager.using(using)
+    batch_size = max(connections[using].ops.bulk_batch_size(fields, objs), 1)
+    for i in range(0, len(objs), batch_size):
+        manager._insert(objs[i:i + batch_size], fields=fields, raw=True, using=using)
@@ -1,3 +1,95 @@
-from django.shortcuts import render
+import json
+from datetime import date
 
-# Create your views here.
+from django.contrib.auth.decorators import permission_required
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET, require_POST
+
+from . import outbox
+from .attendance import mark_attendance
+from .models import Attendance, Group, OutboxConsumer
+
+
+@require_POST
+@permission_required('music_school.add_attendance', raise_exception=True)
+def group_attendance(request, group_id):
+    """Отметка посещаемости всей группы одним запросом.
+
+    Ожидает JSON вида
+    {"date": "2025-09-01", "marks": {"<student_id>": "present", ...}}
+    """
+    group = get_object_or_404(Group, pk=group_id)
+    try:
+        payload = json.loads(request.body)
+        lesson_date = date.fromisoformat(payload['date'])
+        marks = {
+            int(student_id): Attendance.Status[status.upper()]
+            for student_id, status in payload['marks'].items()
+        }
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Некорректные данные отметки'}, status=400)
+
+    try:
+        lesson = mark_attendance(group, lesson_date, marks)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    return JsonResponse({
+        'lesson': lesson.pk,
+        'date': lesson.date.isoformat(),
+        'marked': lesson.marked_count,
+        'attended': lesson.attended_count,
+    })
+
+
+@require_GET
+@permission_required('music_school.view_outboxevent', raise_exception=True)
+def changes(request):
+    """Лента изменений после курсора.
+
+    Курсор задаётся параметром after или берётся из сохранённой позиции
+    потребителя consumer. Следующий запрос делается с after=cursor.
+    """
+    try:
+        limit = int(request.GET.get('limit', 500))
+        if 'after' in request.GET:
+            after = int(request.GET['after'])
+        elif 'consumer' in request.GET:
+            consumer = OutboxConsumer.objects.filter(name=request.GET['consumer']).first()
+            after = consumer.position if consumer else 0
+        else:
+            after = 0
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный курсор'}, status=400)
+    if limit < 1:
+        return JsonResponse({'error': 'limit должен быть положительным'}, status=400)
+
+    events = outbox.fetch(after, min(limit, 5000))
+    return JsonResponse({
+        'events': [
+            {
+                'id': e.pk,
+                'position': e.position,
+                'model': e.model,
+                'object_id': e.object_id,
+                'operation': e.operation,
+                'payload': e.payload,
+                'created_at': e.created_at.isoformat(),
+            }
+            for e in events
+        ],
+        'cursor': events[-1].position if events else after,
+    })
+
+
+@require_POST
+@permission_required('music_school.change_outboxconsumer', raise_exception=True)
+def changes_ack(request):
+    """Подтверждение прочитанной позиции: {"consumer": "accounting", "position": 123}"""
+    try:
+        payload = json.loads(request.body)
+        consumer = outbox.acknowledge(str(payload['consumer']), int(payload['position']))
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Некорректные данные'}, status=400)
+    return JsonResponse({'consumer': consumer.name, 'position': consumer.position})
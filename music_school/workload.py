@@ -0,0 +1,186 @@
+"""Расчёт нагрузки преподавателей по расписанию групп"""
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import router
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .branches import get_current_branch, school_databases, use_database
+
+# Номер дня недели по первым двум буквам сокращения или полного названия
+_DAY_NUMBERS = {
+    'пн': 0, 'по': 0, 'вт': 1, 'ср': 2, 'чт': 3, 'че': 3,
+    'пт': 4, 'пя': 4, 'сб': 5, 'су': 5, 'вс': 6, 'во': 6,
+}
+_DAY = (
+    r'(?:понедельник|вторник|сред[аеуы]|четверг|пятниц[аеуы]|суббот[аеуы]|воскресень[еяю]'
+    r'|пн|вт|ср|чт|пт|сб|вс)'
+)
+_TOKEN_RE = re.compile(
+    r'(?P<h1>\d{1,2})[:.](?P<m1>\d{2})\s*[-–—]\s*(?P<h2>\d{1,2})[:.](?P<m2>\d{2})'
+    rf'|(?<![а-яё])(?P<first>{_DAY})(?:\s*[-–—]\s*(?P<last>{_DAY}))?(?![а-яё])',
+    re.IGNORECASE,
+)
+
+
+def _days(first, last=None):
+    start = _DAY_NUMBERS[first.lower()[:2]]
+    if last is None:
+        return {start}
+    end = _DAY_NUMBERS[last.lower()[:2]]
+    return {(start + i) % 7 for i in range((end - start) % 7 + 1)}
+
+
+def parse_schedule_minutes(schedule):
+    """Количество учебных минут в неделю по строке расписания.
+
+    Каждый интервал времени относится к дням, перечисленным перед ним:
+    «Пн, Ср 16:00-17:30», «Пн 16:00-17:00, Ср 15:00-16:30»,
+    «Пн-Пт 10:00-11:00», «Понедельник 10:00-11:00». Интервал без новых
+    дней перед ним относится к тем же дням, что и предыдущий.
+    Нераспознанные части не учитываются.
+    """
+    total = 0
+    days, pending = set(), set()
+    for match in _TOKEN_RE.finditer(schedule or ''):
+        if match['first']:
+            pending |= _days(match['first'], match['last'])
+            continue
+        if pending:
+            days, pending = pending, set()
+        start = int(match['h1']) * 60 + int(match['m1'])
+        end = int(match['h2']) * 60 + int(match['m2'])
+        if end > start:
+            total += len(days) * (end - start)
+    return total
+
+
+def annotate_workload(queryset):
+    """Добавляет к queryset преподавателей число групп, минуты в неделю и число активных учеников.
+
+    Используются подзапросы, а не join по группам и зачислениям, чтобы
+    суммы не умножались на количество строк зачислений.
+    """
+    from .models import Enrollment, Group
+
+    minutes = (
+        Group.objects.filter(teacher=OuterRef('pk'))
+        .order_by()
+        .values('teacher')
+        .annotate(total=Sum('weekly_minutes'))
+        .values('total')
+    )
+    contacts = (
+        Enrollment.objects.filter(group__teacher=OuterRef('pk'), is_active=True)
+        .order_by()
+        .values('group__teacher')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    groups = (
+        Group.objects.filter(teacher=OuterRef('pk'))
+        .order_by()
+        .values('teacher')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return queryset.annotate(
+        workload_groups=Coalesce(Subquery(groups, output_field=IntegerField()), 0),
+        workload_minutes=Coalesce(Subquery(minutes, output_field=IntegerField()), 0),
+        workload_contacts=Coalesce(Subquery(contacts, output_field=IntegerField()), 0),
+    )
+
+
+def load_status(minutes):
+    """Статус нагрузки по порогам TEACHER_WORKLOAD_MIN_HOURS / TEACHER_WORKLOAD_MAX_HOURS"""
+    hours = minutes / 60
+    if hours > settings.TEACHER_WORKLOAD_MAX_HOURS:
+        return 'over'
+    if hours < settings.TEACHER_WORKLOAD_MIN_HOURS:
+        return 'under'
+    return 'normal'
+
+
+@dataclass
+class TeacherWorkload:
+    teacher_id: int
+    name: str
+    is_active: bool
+    minutes: int = 0
+    contacts: int = 0
+    groups: int = 0
+    database: str = 'default'
+
+    @property
+    def key(self):
+        # id уникальны только в пределах одной базы
+        return self.database, self.teacher_id
+
+    @property
+    def hours(self):
+        return round(self.minutes / 60, 1)
+
+    @property
+    def status(self):
+        return load_status(self.minutes)
+
+
+def compute_workload():
+    """Нагрузка всех преподавателей и сводка по направлениям.
+
+    Вне контекста филиала обходит все базы школы, в каждой делает два
+    запроса: группы с числом активных зачислений и преподаватели.
+    Возвращает (список TeacherWorkload, словарь направлений), где для
+    каждого направления (ключ - база и id) указаны суммарные минуты и
+    минуты каждого преподавателя (ключ - TeacherWorkload.key).
+    """
+    from .models import Teacher
+
+    if get_current_branch() is not None:
+        return _database_workload(router.db_for_read(Teacher))
+    workloads, directions = [], {}
+    for database in school_databases():
+        with use_database(database):
+            database_workloads, database_directions = _database_workload(database)
+        workloads += database_workloads
+        directions.update(database_directions)
+    return workloads, directions
+
+
+def _database_workload(database):
+    from .models import Direction, Group, Teacher
+
+    teachers = Teacher.objects.only('first_name', 'last_name', 'middle_name', 'is_active')
+    workloads = {
+        t.pk: TeacherWorkload(teacher_id=t.pk, name=t.full_name, is_active=t.is_active, database=database)
+        for t in teachers
+    }
+    direction_names = dict(Direction.objects.values_list('pk', 'name'))
+    directions = {}
+
+    rows = (
+        Group.objects.filter(teacher__isnull=False)
+        .order_by()
+        .values('pk', 'teacher_id', 'direction_id', 'weekly_minutes')
+        .annotate(contacts=Count('enrollment', filter=Q(enrollment__is_active=True)))
+    )
+    for row in rows:
+        workload = workloads.get(row['teacher_id'])
+        if workload is None:
+            continue
+        minutes = row['weekly_minutes']
+        workload.minutes += minutes
+        workload.contacts += row['contacts']
+        workload.groups += 1
+
+        summary = directions.setdefault((database, row['direction_id']), {
+            'name': direction_names.get(row['direction_id'], ''),
+            'minutes': 0,
+            'teachers': {},
+        })
+        summary['minutes'] += minutes
+        summary['teachers'][workload.key] = summary['teachers'].get(workload.key, 0) + minutes
+
+    return list(workloads.values()), directions